@@ -0,0 +1,267 @@
+#-*- coding: utf-8 -*-
+
+# expectimax player
+
+from collections import OrderedDict
+from functools import lru_cache
+import time
+
+from game2048 import Engine, Move, RATIO_2_ON_4
+
+bitboard = None  # imported by the first _BitboardOps, only the 4x4 grids use it
+BITBOARD_SIZE = 4  # size of the grids searched on bitboards
+
+# probabilities of the spawned values
+PROBABILITY_2 = RATIO_2_ON_4 / (RATIO_2_ON_4 + 1)
+PROBABILITY_4 = 1 / (RATIO_2_ON_4 + 1)
+
+# heuristic weights
+LOST_PENALTY = 200000.
+EMPTY_WEIGHT = 270.
+MERGE_WEIGHT = 700.
+MONOTONICITY_WEIGHT = 47.
+SUM_WEIGHT = 11.
+
+
+@lru_cache(maxsize=None)
+def _rowHeuristic(row: tuple) -> float:
+    """ evaluate a row of exponents: empty squares and merges are good, non-monotonic rows are bad """
+    empty = row.count(0)
+    merges = 0
+    previous = 0
+    counter = 0
+    for exponent in row:
+        if exponent == 0:
+            continue
+        if exponent == previous:
+            counter += 1
+        elif counter > 0:
+            merges += 1 + counter
+            counter = 0
+        previous = exponent
+    if counter > 0:
+        merges += 1 + counter
+
+    left = right = 0.
+    for a, b in zip(row, row[1:]):
+        if a > b:
+            left += a ** 4 - b ** 4
+        else:
+            right += b ** 4 - a ** 4
+
+    return (LOST_PENALTY + EMPTY_WEIGHT * empty + MERGE_WEIGHT * merges
+            - MONOTONICITY_WEIGHT * min(left, right) - SUM_WEIGHT * sum(exponent ** 3.5 for exponent in row))
+
+
+@lru_cache(maxsize=None)
+def _slideRow(row: tuple):
+    """ slide and merge a row of exponents to the left, return the new row and the score gained """
+    cells = [exponent for exponent in row if exponent != 0]
+    merged = []
+    gain = 0
+    i = 0
+    while i < len(cells):
+        if i + 1 < len(cells) and cells[i] == cells[i + 1]:
+            merged.append(cells[i] + 1)
+            gain += 2 ** (cells[i] + 1)
+            i += 2
+        else:
+            merged.append(cells[i])
+            i += 1
+    return tuple(merged) + (0,) * (len(row) - len(merged)), gain
+
+
+@lru_cache(maxsize=None)
+def _bitboardRowHeuristic(row: int) -> float:
+    return _rowHeuristic(tuple(bitboard._unpackRow(row)))
+
+
+class _BitboardOps(object):
+    """ board operations on 4x4 bitboards """
+    size = BITBOARD_SIZE
+
+    def __init__(self):
+        global bitboard
+        import bitboard
+        # the row tables are built now rather than by the first move, within the time budget of a search
+        bitboard._tables()
+        self.move = bitboard.moveBoard
+        self.empty = bitboard.emptyCells
+
+    @staticmethod
+    def fromEngine(engine: Engine) -> int:
+        if isinstance(engine, bitboard.BitboardEngine):
+            return engine.board
+        board = 0
+        for i, exponent in enumerate(engine.exponents):
+            board |= exponent << (4 * i)
+        return board
+
+    @staticmethod
+    def place(board: int, cell: int, exponent: int) -> int:
+        return board | (exponent << (4 * cell))
+
+    @staticmethod
+    def heuristic(board: int) -> float:
+        total = 0.
+        for rows in (board, bitboard.transpose(board)):
+            for shift in range(0, 64, 16):
+                total += _bitboardRowHeuristic((rows >> shift) & bitboard.ROW_MASK)
+        return total
+
+
+class _TupleOps(object):
+    """ board operations on row-major tuples of exponents, for any grid size """
+    def __init__(self, size: int):
+        self.size = size
+        # indexes of the squares of each line, ordered so that the line slides toward its start
+        lines = {Move.LEFT: [[y * size + x for x in range(size)] for y in range(size)],
+                 Move.UP: [[y * size + x for y in range(size)] for x in range(size)]}
+        lines[Move.RIGHT] = [line[::-1] for line in lines[Move.LEFT]]
+        lines[Move.DOWN] = [line[::-1] for line in lines[Move.UP]]
+        self.lines = lines
+
+    def fromEngine(self, engine: Engine) -> tuple:
+        return tuple(engine.exponents)
+
+    def move(self, board: tuple, side: Move):
+        cells = list(board)
+        gain = 0
+        for line in self.lines[side]:
+            row, rowGain = _slideRow(tuple(board[i] for i in line))
+            gain += rowGain
+            for i, exponent in zip(line, row):
+                cells[i] = exponent
+        return tuple(cells), gain
+
+    @staticmethod
+    def empty(board: tuple) -> list:
+        return [i for i, exponent in enumerate(board) if exponent == 0]
+
+    @staticmethod
+    def place(board: tuple, cell: int, exponent: int) -> tuple:
+        return board[:cell] + (exponent,) + board[cell + 1:]
+
+    def heuristic(self, board: tuple) -> float:
+        total = 0.
+        for side in (Move.LEFT, Move.UP):
+            for line in self.lines[side]:
+                total += _rowHeuristic(tuple(board[i] for i in line))
+        return total
+
+
+class _BudgetExceeded(Exception):
+    """ raised to abort a search that ran out of time or nodes """
+
+
+class ExpectimaxPlayer(object):
+    """ choose moves with an iterative deepening expectimax search
+
+    time_budget is in seconds per move, node_budget (optional) caps the nodes visited per move,
+    spawns whose cumulated probability falls below min_probability are not explored
+    """
+    def __init__(self, time_budget=0.05, node_budget=None, max_depth=8, table_size=1 << 18,
+                 min_probability=1e-4):
+        self.timeBudget = time_budget
+        self.nodeBudget = node_budget
+        self.maxDepth = max_depth
+        self.tableSize = table_size
+        self.minProbability = min_probability
+        self._table = OrderedDict()
+        self._ops = None
+        self._deadline = 0.
+        self._cancelled = None
+        self._checkMask = 0xFF  # the clock is read every checkMask + 1 nodes
+        self.nodes = 0
+        self.depth = 0
+
+    def __call__(self, engine: Engine):
+        return self.bestMove(engine)
+
+    def _opsFor(self, engine: Engine):
+        size = engine.gridSize
+        if self._ops is None or self._ops.size != size:
+            self._ops = _BitboardOps() if size == BITBOARD_SIZE else _TupleOps(size)
+            self._table.clear()
+            # the nodes of large grids are slow enough to read the clock at each of them
+            self._checkMask = 0xFF if size <= 8 else 0
+        return self._ops
+
+    def _visit(self):
+        self.nodes += 1
+        if self.nodes & self._checkMask == 0:
+            if time.perf_counter() > self._deadline or (self._cancelled is not None and self._cancelled.is_set()):
+                raise _BudgetExceeded
+        if self.nodeBudget is not None and self.nodes > self.nodeBudget:
+            raise _BudgetExceeded
+
+    def _maxNode(self, board, depth: int, probability: float) -> float:
+        self._visit()
+        best = 0.
+        for side in Move:
+            moved, gain = self._ops.move(board, side)
+            if moved != board:
+                best = max(best, self._chanceNode(moved, depth, probability))
+        return best
+
+    def _chanceNode(self, board, depth: int, probability: float) -> float:
+        if depth == 0 or probability < self.minProbability:
+            return self._ops.heuristic(board)
+
+        entry = self._table.get(board)
+        if entry is not None and entry[0] >= depth:
+            self._table.move_to_end(board)
+            return entry[1]
+
+        cells = self._ops.empty(board)
+        probability /= len(cells)
+        total = 0.
+        for cell in cells:
+            total += PROBABILITY_2 * self._maxNode(self._ops.place(board, cell, 1), depth - 1,
+                                                   probability * PROBABILITY_2)
+            total += PROBABILITY_4 * self._maxNode(self._ops.place(board, cell, 2), depth - 1,
+                                                   probability * PROBABILITY_4)
+        value = total / len(cells)
+
+        self._table[board] = (depth, value)
+        self._table.move_to_end(board)
+        if len(self._table) > self.tableSize:
+            self._table.popitem(last=False)
+        return value
+
+    def _root(self, board, depth: int):
+        best, bestValue = None, -1.
+        for side in Move:
+            moved, gain = self._ops.move(board, side)
+            if moved != board:
+                value = self._chanceNode(moved, depth, 1.)
+                if value > bestValue:
+                    best, bestValue = side, value
+        return best
+
+    def bestMove(self, engine: Engine, cancelled=None):
+        """ return the best Move for the engine grid, or None if the game is over
+
+        cancelled is an optional threading.Event, which stops the search once set (from another thread, even before
+        the search starts), the best move found so far being returned
+        """
+        ops = self._opsFor(engine)
+        board = ops.fromEngine(engine)
+        self.nodes = 0
+        self.depth = 0
+        self._deadline = time.perf_counter() + self.timeBudget
+        self._cancelled = cancelled
+
+        legal = [side for side in Move if ops.move(board, side)[0] != board]
+        if not legal:
+            return None
+        best = legal[0]
+        for depth in range(1, self.maxDepth + 1):
+            if cancelled is not None and cancelled.is_set():
+                break
+            try:
+                best = self._root(board, depth)
+            except _BudgetExceeded:
+                break
+            self.depth = depth
+        return best
@@ -0,0 +1,139 @@
+#-*- coding: utf-8 -*-
+
+# NumPy backend stepping many games at once
+
+import numpy as np
+
+from game2048 import Move, GRID_SIZE, RATIO_2_ON_4
+
+
+def _orient(grids: np.ndarray, side: Move) -> np.ndarray:
+    """ return a view of the grids where the given side becomes LEFT """
+    if side is Move.LEFT:
+        return grids
+    if side is Move.RIGHT:
+        return grids[:, :, ::-1]
+    if side is Move.UP:
+        return grids.transpose(0, 2, 1)
+    return grids.transpose(0, 2, 1)[:, :, ::-1]
+
+
+def _restore(grids: np.ndarray, side: Move) -> np.ndarray:
+    """ undo _orient """
+    if side is Move.DOWN:
+        return grids[:, :, ::-1].transpose(0, 2, 1)
+    return _orient(grids, side)
+
+
+def _compact(rows: np.ndarray) -> np.ndarray:
+    """ push the non-empty squares of each row to its start, keeping their order """
+    order = np.argsort(rows == 0, axis=1, kind='stable')
+    return np.take_along_axis(rows, order, axis=1)
+
+
+def mergeRows(rows: np.ndarray):
+    """ slide and merge a (rows, size) array of exponents to the left, return the new rows and their score gain """
+    rows = _compact(rows)
+    size = rows.shape[1]
+    columns = np.arange(size)
+
+    # a square merges with the next one when they are equal and it sits at an even offset of its run
+    equal = (rows[:, 1:] == rows[:, :-1]) & (rows[:, :-1] != 0)
+    newRun = np.ones(rows.shape, dtype=bool)
+    newRun[:, 1:] = ~equal
+    runStart = np.maximum.accumulate(np.where(newRun, columns, 0), axis=1)
+    merge = equal & ((columns[:-1] - runStart[:, :-1]) % 2 == 0)
+
+    gain = np.where(merge, np.left_shift(1, rows[:, :-1].astype(np.int64) + 1), 0).sum(axis=1)
+    rows[:, :-1][merge] += 1
+    rows[:, 1:][merge] = 0
+    return _compact(rows), gain
+
+
+class BatchEngine(object):
+    """ Game core for many grids held in a single (count, size, size) array of log2 exponents """
+    def __init__(self, count: int, size=GRID_SIZE, seed=None):
+        self.count = count
+        self.gridSize = size
+        self._rng = np.random.default_rng(seed)
+        self._grid = np.zeros((count, size, size), dtype=np.uint8)
+        self._score = np.zeros(count, dtype=np.int64)
+        self.start()
+
+    @property
+    def grid(self) -> np.ndarray:
+        """ exponents indexed by [board, y, x], 0 being an empty square """
+        return self._grid
+
+    @property
+    def score(self) -> np.ndarray:
+        return self._score
+
+    def start(self, mask=None):
+        """ reset the selected boards (all of them by default) """
+        if mask is None:
+            mask = np.ones(self.count, dtype=bool)
+        self._grid[mask] = 0
+        self._score[mask] = 0
+        self.newGridItems(mask)
+
+    def newGridItems(self, mask=None) -> np.ndarray:
+        """ add a new square on each selected board, and return which boards received one """
+        flat = self._grid.reshape(self.count, -1)
+        empty = flat == 0
+        spawn = empty.any(axis=1)
+        if mask is not None:
+            spawn &= mask
+
+        # the empty square with the highest random key is picked, which is uniform among empty squares
+        keys = self._rng.random(flat.shape)
+        keys[~empty] = -1
+        cells = keys.argmax(axis=1)
+        values = np.where(self._rng.integers(0, RATIO_2_ON_4 + 1, self.count) == 0, 2, 1).astype(np.uint8)
+
+        boards = np.flatnonzero(spawn)
+        flat[boards, cells[boards]] = values[boards]
+        return spawn
+
+    def testEnd(self) -> np.ndarray:
+        """ return which boards are over (no empty square and no identical neighbours) """
+        grid = self._grid
+        alive = (grid == 0).any(axis=(1, 2))
+        alive |= (grid[:, :, 1:] == grid[:, :, :-1]).any(axis=(1, 2))
+        alive |= (grid[:, 1:, :] == grid[:, :-1, :]).any(axis=(1, 2))
+        return ~alive
+
+    def legalMoves(self) -> np.ndarray:
+        """ return a (count, 4) mask of the sides that would modify each board, ordered as Move """
+        legal = np.empty((self.count, len(Move)), dtype=bool)
+        for side in Move:
+            grids = _orient(self._grid, side)
+            head, tail = grids[:, :, :-1], grids[:, :, 1:]
+            legal[:, side.value] = (((head == 0) & (tail != 0)) | ((head == tail) & (head != 0))).any(axis=(1, 2))
+        return legal
+
+    def moveGrids(self, moves) -> np.ndarray:
+        """ slide and merge each board toward its own side (Move.value), and return which boards changed """
+        moves = np.asarray(moves)
+        changed = np.zeros(self.count, dtype=bool)
+        size = self.gridSize
+
+        for side in Move:
+            boards = np.flatnonzero(moves == side.value)
+            if boards.size == 0:
+                continue
+            grids = self._grid[boards]
+            rows, gain = mergeRows(_orient(grids, side).reshape(-1, size))
+            moved = _restore(rows.reshape(-1, size, size), side)
+
+            changed[boards] = (moved != grids).any(axis=(1, 2))
+            self._grid[boards] = moved
+            self._score[boards] += gain.reshape(-1, size).sum(axis=1)
+        return changed
+
+    def step(self, moves):
+        """ play one move on every board, spawn on the boards that changed,
+        and return the changed and game over masks """
+        changed = self.moveGrids(moves)
+        self.newGridItems(changed)
+        return changed, self.testEnd()
@@ -0,0 +1,186 @@
+#-*- coding: utf-8 -*-
+
+# engine benchmarks: time the engine operations on several grid sizes, boards and backends
+# and write machine-readable results that can be compared between commits
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from game2048 import Engine, Move
+import bitboard
+
+try:
+    import numpy
+    import batch
+except ImportError:
+    batch = None
+
+SIZES = (4, 8, 16, 64)
+BOARDS = ('random', 'dead', 'merge')
+OPERATIONS = ('moveGridItems', 'sumGridItems', 'move', 'newGridItem', 'testEnd')
+BATCH_COUNT = 1024  # boards stepped per call by the batch backend
+
+
+def makeBoard(kind: str, size: int, rng: random.Random) -> bytes:
+    """ return the row-major exponents of a benchmark board
+
+    random: squares drawn between empty and 2 ** 10, dead: a full checkerboard of 2 and 4 (no legal move,
+    which is the worst case of testEnd), merge: a full board of 2 (every line merges)
+    """
+    if kind == 'random':
+        return bytes(rng.choice((0, 0, 0) + tuple(range(1, 11))) for i in range(size * size))
+    if kind == 'dead':
+        return bytes(1 + (x + y) % 2 for y in range(size) for x in range(size))
+    if kind == 'merge':
+        return bytes([1] * (size * size))
+    raise ValueError(f'unknown board {kind}')
+
+
+def spawnBoard(exponents: bytes, size: int) -> bytes:
+    """ return a board with its diagonal emptied, so that the full boards time actual spawns """
+    squares = bytearray(exponents)
+    squares[::size + 1] = bytes(size)
+    return bytes(squares)
+
+
+def _time(engine: Engine, exponents: bytes, call, repeat: int) -> list:
+    """ return the duration of each call in ns, the board being reloaded before each of them """
+    durations = []
+    for i in range(repeat):
+        engine.load(exponents)
+        start = time.perf_counter_ns()
+        call()
+        durations.append(time.perf_counter_ns() - start)
+    return durations
+
+
+def _result(backend: str, size: int, board: str, operation: str, durations: list, unit=1) -> dict:
+    return {'backend': backend, 'size': size, 'board': board, 'operation': operation,
+            'ns_median': statistics.median(durations) / unit, 'ns_min': min(durations) / unit,
+            'calls': len(durations)}
+
+
+def benchOperations(engine_class, backend: str, size: int, repeat: int, seed: int):
+    rng = random.Random(seed)
+    engine = engine_class(size, seed=seed)
+    for board in BOARDS:
+        exponents = makeBoard(board, size, rng)
+        for operation in OPERATIONS:
+            if operation in ('moveGridItems', 'sumGridItems', 'move'):
+                for side in Move:
+                    durations = _time(engine, exponents, lambda: getattr(engine, operation)(side), repeat)
+                    yield _result(backend, size, board, f'{operation}.{side.name}', durations)
+            elif operation == 'newGridItem':
+                yield _result(backend, size, board, operation,
+                              _time(engine, spawnBoard(exponents, size), engine.newGridItem, repeat))
+            else:
+                yield _result(backend, size, board, operation,
+                              _time(engine, exponents, getattr(engine, operation), repeat))
+
+
+def benchGames(engine_class, backend: str, size: int, max_moves: int, seed: int):
+    """ play random games up to max_moves moves and report the time per move """
+    rng = random.Random(seed)
+    engine = engine_class(size, seed=seed)
+    moves = 0
+    start = time.perf_counter_ns()
+    while moves < max_moves:
+        legal = engine.legalMoves()
+        if not any(legal):
+            engine.start()
+            continue
+        side = rng.choice([side for side in Move if legal[side.value]])
+        engine.move(side)
+        engine.newGridItem()
+        moves += 1
+    yield _result(backend, size, 'game', 'move', [time.perf_counter_ns() - start], moves)
+
+
+def benchBatch(size: int, repeat: int, seed: int):
+    """ time one step of BATCH_COUNT boards and report the time per board """
+    engines = batch.BatchEngine(BATCH_COUNT, size, seed=seed)
+    rng = numpy.random.default_rng(seed)
+    for board in BOARDS:
+        exponents = makeBoard(board, size, random.Random(seed))
+        grid = numpy.frombuffer(exponents, dtype=numpy.uint8).reshape(size, size)
+        durations = []
+        for i in range(repeat):
+            engines.grid[:] = grid
+            moves = rng.integers(0, len(Move), BATCH_COUNT)
+            start = time.perf_counter_ns()
+            engines.step(moves)
+            durations.append(time.perf_counter_ns() - start)
+        yield _result('batch', size, board, 'step', durations, BATCH_COUNT)
+
+
+def run(sizes=SIZES, repeat=30, max_moves=2000, seed=0):
+    """ yield a result dict per (backend, size, board, operation) """
+    for size in sizes:
+        yield from benchOperations(Engine, 'engine', size, repeat, seed)
+        yield from benchGames(Engine, 'engine', size, max_moves, seed)
+        if size == bitboard.BOARD_SIZE:
+            yield from benchOperations(bitboard.BitboardEngine, 'bitboard', size, repeat, seed)
+            yield from benchGames(bitboard.BitboardEngine, 'bitboard', size, max_moves, seed)
+        if batch is not None:
+            yield from benchBatch(size, repeat, seed)
+
+
+def _revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """ return (key, baseline ns, current ns) of the results slower than the baseline by more than tolerance """
+    reference = {(r['backend'], r['size'], r['board'], r['operation']): r['ns_median'] for r in baseline}
+    regressions = []
+    for result in results:
+        key = (result['backend'], result['size'], result['board'], result['operation'])
+        if key in reference and result['ns_median'] > reference[key] * (1 + tolerance):
+            regressions.append((key, reference[key], result['ns_median']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark the 2048 engines')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=30, help='calls timed per operation')
+    parser.add_argument('--moves', type=int, default=2000, help='moves played for the game throughput')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = []
+    for result in run(args.sizes, args.repeat, args.moves, args.seed):
+        results.append(result)
+        print('{backend:>8} {size:>3} {board:>6} {operation:<22} {ns_median:>14.0f} ns'.format(**result),
+              flush=True)
+
+    report = {'revision': _revision(), 'python': platform.python_version(), 'platform': platform.platform(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file)['results'], args.tolerance)
+        for key, before, after in regressions:
+            print('regression: {} {} {} {}: {:.0f} -> {:.0f} ns'.format(*key, before, after))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
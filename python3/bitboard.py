@@ -0,0 +1,326 @@
+#-*- coding: utf-8 -*-
+
+# 64-bit bitboard backend for the 4x4 game
+
+from array import array
+from collections import namedtuple
+from functools import lru_cache
+import types
+
+from game2048 import Engine, Move, TileMove, boardHashes
+
+# the board is a 64-bit integer holding 16 nibbles, each nibble being the log2 exponent of a square
+# (0 means empty), the square (x, y) is stored at bit 4 * (4 * y + x): each row is a 16-bit word
+BOARD_SIZE = 4
+ROW_MASK = 0xFFFF
+CELL_MASK = 0xF
+MAX_EXPONENT = 15  # 2 ** 15 = 32768, two of those can not be merged in a nibble
+
+
+def _unpackRow(row: int) -> list:
+    return [(row >> (4 * i)) & CELL_MASK for i in range(BOARD_SIZE)]
+
+
+def _packRow(cells) -> int:
+    row = 0
+    for i, cell in enumerate(cells):
+        row |= cell << (4 * i)
+    return row
+
+
+def _reverseRow(row: int) -> int:
+    return ((row & 0xF) << 12) | ((row & 0xF0) << 4) | ((row >> 4) & 0xF0) | (row >> 12)
+
+
+def _sumCells(cells: list):
+    """ merge identical neighbours without sliding, as Engine.sumGridItems does (pairs of empty squares being
+    dropped as well), return the new cells and the score gained """
+    cells = list(cells)
+    gain = 0
+    i = 0
+    while i < len(cells) - 1:
+        if cells[i] == cells[i + 1] and cells[i] < MAX_EXPONENT:
+            if cells[i]:
+                cells[i] += 1
+                gain += 1 << cells[i]
+            cells.pop(i + 1)
+        i += 1
+    return cells, gain
+
+
+# row tables: result of each kind of move for every possible row, and the score gained
+_Tables = namedtuple('_Tables', 'slideLeft slideRight moveLeft moveRight scoreLeft scoreRight '
+                                'sumLeft sumRight sumScoreLeft sumScoreRight')
+
+
+@lru_cache(maxsize=None)
+def _tables() -> _Tables:
+    """ compute the row tables, on first use: importing the module stays cheap for the other grid sizes """
+    slide = array('H', bytes(2 * (ROW_MASK + 1)))
+    left = array('H', bytes(2 * (ROW_MASK + 1)))
+    score = array('L', bytes(array('L').itemsize * (ROW_MASK + 1)))
+    total = array('H', bytes(2 * (ROW_MASK + 1)))
+    totalScore = array('L', bytes(array('L').itemsize * (ROW_MASK + 1)))
+
+    for row in range(ROW_MASK + 1):
+        unpacked = _unpackRow(row)
+        summed, gain = _sumCells(unpacked)
+        total[row] = _packRow(summed)
+        totalScore[row] = gain
+
+        cells = [cell for cell in unpacked if cell != 0]
+        slide[row] = _packRow(cells)
+
+        merged = []
+        gain = 0
+        i = 0
+        while i < len(cells):
+            if i + 1 < len(cells) and cells[i] == cells[i + 1] and cells[i] < MAX_EXPONENT:
+                merged.append(cells[i] + 1)
+                gain += 2 ** (cells[i] + 1)
+                i += 2
+            else:
+                merged.append(cells[i])
+                i += 1
+        left[row] = _packRow(merged)
+        score[row] = gain
+
+    def mirror(table, typecode):
+        return array(typecode, (_reverseRow(table[_reverseRow(row)]) for row in range(ROW_MASK + 1)))
+
+    return _Tables(slide, mirror(slide, 'H'), left, mirror(left, 'H'),
+                   score, array('L', (score[_reverseRow(row)] for row in range(ROW_MASK + 1))),
+                   total, mirror(total, 'H'),
+                   totalScore, array('L', (totalScore[_reverseRow(row)] for row in range(ROW_MASK + 1))))
+
+
+def transpose(board: int) -> int:
+    """ swap rows and columns of a board """
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def _applyRows(board: int, table) -> int:
+    return (table[board & ROW_MASK]
+            | (table[(board >> 16) & ROW_MASK] << 16)
+            | (table[(board >> 32) & ROW_MASK] << 32)
+            | (table[(board >> 48) & ROW_MASK] << 48))
+
+
+def _scoreRows(board: int, table) -> int:
+    return (table[board & ROW_MASK] + table[(board >> 16) & ROW_MASK]
+            + table[(board >> 32) & ROW_MASK] + table[(board >> 48) & ROW_MASK])
+
+
+def moveBoard(board: int, side: Move):
+    """ slide and merge the board toward the given side, return the new board and the score gained """
+    tables = _tables()
+    if side is Move.LEFT:
+        return _applyRows(board, tables.moveLeft), _scoreRows(board, tables.scoreLeft)
+    if side is Move.RIGHT:
+        return _applyRows(board, tables.moveRight), _scoreRows(board, tables.scoreRight)
+    board = transpose(board)
+    if side is Move.UP:
+        return transpose(_applyRows(board, tables.moveLeft)), _scoreRows(board, tables.scoreLeft)
+    return transpose(_applyRows(board, tables.moveRight)), _scoreRows(board, tables.scoreRight)
+
+
+def slideBoard(board: int, side: Move) -> int:
+    """ slide the board toward the given side without merging """
+    tables = _tables()
+    if side is Move.LEFT:
+        return _applyRows(board, tables.slideLeft)
+    if side is Move.RIGHT:
+        return _applyRows(board, tables.slideRight)
+    board = transpose(board)
+    if side is Move.UP:
+        return transpose(_applyRows(board, tables.slideLeft))
+    return transpose(_applyRows(board, tables.slideRight))
+
+
+def sumBoard(board: int, side: Move):
+    """ merge the identical neighbours of the board toward the given side without sliding,
+    return the new board and the score gained """
+    tables = _tables()
+    if side is Move.LEFT:
+        return _applyRows(board, tables.sumLeft), _scoreRows(board, tables.sumScoreLeft)
+    if side is Move.RIGHT:
+        return _applyRows(board, tables.sumRight), _scoreRows(board, tables.sumScoreRight)
+    board = transpose(board)
+    if side is Move.UP:
+        return transpose(_applyRows(board, tables.sumLeft)), _scoreRows(board, tables.sumScoreLeft)
+    return transpose(_applyRows(board, tables.sumRight)), _scoreRows(board, tables.sumScoreRight)
+
+
+def emptyCells(board: int) -> list:
+    """ return the nibble indexes of the empty squares """
+    return [i for i in range(BOARD_SIZE * BOARD_SIZE) if (board >> (4 * i)) & CELL_MASK == 0]
+
+
+class BitboardEngine(Engine):
+    """ Game core for 4x4 grids, packed into a single 64-bit integer """
+    __slots__ = ('_board', '_shown', '_reference')
+
+    def __init__(self, size=BOARD_SIZE, seed=None, rng=None, hashing=False):
+        if size != BOARD_SIZE:
+            raise ValueError(f'{self.__class__.__name__} only supports {BOARD_SIZE}x{BOARD_SIZE} grids')
+        self._reference = None  # Engine computing the transitions, built on the first request
+        # the hashes of a board are always computed when read
+        Engine.__init__(self, size, seed, rng)
+
+    @property
+    def board(self) -> int:
+        return self._board
+
+    @property
+    def exponents(self) -> bytes:
+        """ copy of the row-major log2 exponents of the squares """
+        return bytes((self._board >> (4 * i)) & CELL_MASK for i in range(BOARD_SIZE * BOARD_SIZE))
+
+    @property
+    def emptyCells(self):
+        """ set of the (x, y) coordinates of the empty squares """
+        return frozenset((i % BOARD_SIZE, i // BOARD_SIZE) for i in emptyCells(self._board))
+
+    @property
+    def maxTile(self) -> int:
+        exponent = max((self._board >> (4 * i)) & CELL_MASK for i in range(BOARD_SIZE * BOARD_SIZE))
+        return 1 << exponent if exponent else 0
+
+    @property
+    def histogram(self):
+        """ mapping of each square value on the grid to its number of occurrences """
+        histogram = {}
+        for i in range(BOARD_SIZE * BOARD_SIZE):
+            exponent = (self._board >> (4 * i)) & CELL_MASK
+            if exponent:
+                histogram[1 << exponent] = histogram.get(1 << exponent, 0) + 1
+        return types.MappingProxyType(histogram)
+
+    def _boardHashes(self) -> int:
+        # computed from the board, which is not updated square by square
+        return boardHashes(self.exponents, BOARD_SIZE)
+
+    def popChangedCells(self) -> set:
+        """ return the (x, y) coordinates of the squares modified since the last call """
+        diff = self._board ^ self._shown if self._shown is not None else -1
+        self._shown = self._board
+        return {(i % BOARD_SIZE, i // BOARD_SIZE) for i in range(BOARD_SIZE * BOARD_SIZE)
+                if (diff >> (4 * i)) & CELL_MASK}
+
+    def getGridItem(self, x, y, side=None) -> int:
+        x, y = self._compose(x, y, side)
+
+        if (0 <= x <= BOARD_SIZE - 1) and (0 <= y <= BOARD_SIZE - 1):
+            exponent = (self._board >> (4 * (BOARD_SIZE * y + x))) & CELL_MASK
+            return 1 << exponent if exponent else 0
+        raise OverflowError
+
+    def setGridItem(self, x, y, value: int, side=None):
+        x, y = self._compose(x, y, side)
+
+        if (0 <= x <= BOARD_SIZE - 1) and (0 <= y <= BOARD_SIZE - 1):
+            exponent = value.bit_length() - 1 if value else 0
+            if value != (1 << exponent if exponent else 0) or exponent > MAX_EXPONENT:
+                raise ValueError(f'{value} can not be stored on a bitboard')
+            shift = 4 * (BOARD_SIZE * y + x)
+            self._board = (self._board & ~(CELL_MASK << shift)) | (exponent << shift)
+        else:
+            raise OverflowError
+
+    def _transitions(self, method, side: Move, transitions: list):
+        """ append the TileMove of a move to transitions, as computed by the Engine method on the same grid """
+        reference = getattr(self, '_reference', None)  # unset on the engines restored without __init__
+        if reference is None:
+            # fixed seed: its spawns are never used, the OS entropy need not be read
+            reference = self._reference = Engine(BOARD_SIZE, seed=0)
+        reference.load(self.exponents)
+        method(reference, side, transitions=transitions)
+
+    def newGridItem(self, transitions=None):
+        """ add a new square, appending its TileMove to the optional transitions list """
+        empty_squares = emptyCells(self._board)
+
+        if len(empty_squares) > 0:
+            position, exponent = self._drawSpawn(len(empty_squares))
+            square = empty_squares[position]
+            self._board |= exponent << (4 * square)
+            self._lastSpawn = square, exponent
+            if transitions is not None:
+                transitions.append(TileMove(None, (square % BOARD_SIZE, square // BOARD_SIZE), 1 << exponent, False))
+            return True
+        else:
+            self._lastSpawn = None
+            return False
+
+    def start(self, seed=None):
+        if seed is not None:
+            self.reseed(seed)
+        self._score = 0
+        self._board = 0
+        self._shown = None
+        self.newGridItem()
+
+    def load(self, exponents: bytes, score=0, empty=None):
+        """ replace the grid by row-major log2 exponents and set the score, the generator is left untouched
+        (the squares always spawn in the increasing order of the empty ones, empty is ignored) """
+        if len(exponents) != BOARD_SIZE * BOARD_SIZE or max(exponents) > MAX_EXPONENT:
+            raise ValueError('the exponents can not be stored on a bitboard')
+        self._score = score
+        self._board = int.from_bytes(bytes(a | b << 4 for a, b in zip(exponents[::2], exponents[1::2])), 'little')
+        self._shown = None
+        self._lastSpawn = None
+
+    def legalMoves(self) -> tuple:
+        """ return whether each side would modify the grid, ordered as Move, without modifying anything """
+        tables = _tables()
+        board = self._board
+        transposed = transpose(board)
+        return (_applyRows(board, tables.moveLeft) != board,
+                _applyRows(board, tables.moveRight) != board,
+                _applyRows(transposed, tables.moveLeft) != transposed,
+                _applyRows(transposed, tables.moveRight) != transposed)
+
+    def move(self, side: Move, transitions=None):
+        """ slide and merge items in a single step, and return whether the grid was modified or not
+
+        the TileMove of each moved or merged square is appended to the optional transitions list
+        """
+        side = side or Move.LEFT
+        board, gain = moveBoard(self._board, side)
+        if board == self._board:
+            return False
+        if transitions is not None:
+            self._transitions(Engine.move, side, transitions)
+        self._board = board
+        self._score += gain
+        return True
+
+    def moveGridItems(self, side, apply=True, transitions=None):
+        """ move items depending on the side, and return whether the grid was modified or not """
+        side = side or Move.LEFT  # None is LEFT, as for getGridItem
+        board = slideBoard(self._board, side)
+        touched = board != self._board
+        if apply is True:
+            if touched and transitions is not None:
+                self._transitions(Engine.moveGridItems, side, transitions)
+            self._board = board
+        return touched
+
+    def sumGridItems(self, side, apply=True, transitions=None):
+        """ sum identical squares depending on the side, and return whether the grid was modified or not """
+        side = side or Move.LEFT
+        board, gain = sumBoard(self._board, side)
+        touched = board != self._board
+        if apply is True:
+            if touched and transitions is not None:
+                self._transitions(Engine.sumGridItems, side, transitions)
+            self._board = board
+            self._score += gain
+        return touched
@@ -0,0 +1,61 @@
+#-*- coding: utf-8 -*-
+
+# gym-style vectorized environment for reinforcement learning
+
+import numpy as np
+
+from game2048 import Move, GRID_SIZE
+from batch import BatchEngine
+
+
+class VectorEnv(object):
+    """ count games stepped together over a BatchEngine
+
+    observations are (count, size, size) uint8 log2 exponents, actions are Move values,
+    rewards are the score gained by each step, finished games are reset automatically
+    """
+    def __init__(self, count: int, size=GRID_SIZE, seed=None):
+        self.count = count
+        self.gridSize = size
+        self.actionCount = len(Move)
+        self._engine = BatchEngine(count, size, seed)
+        self._observations = np.empty((count, size, size), dtype=np.uint8)
+        self._rewards = np.empty(count, dtype=np.float32)
+        # score of each game that finished during the last step (0 for the others)
+        self.finalScores = np.zeros(count, dtype=np.int64)
+
+    @property
+    def engine(self) -> BatchEngine:
+        return self._engine
+
+    def _observe(self) -> np.ndarray:
+        np.copyto(self._observations, self._engine.grid)
+        return self._observations
+
+    def reset(self, seed=None):
+        """ restart every game, and return the observations and the legal actions masks
+
+        the returned arrays are reused by the following calls: copy them to keep them
+        """
+        if seed is not None:
+            self._engine = BatchEngine(self.count, self.gridSize, seed)
+        else:
+            self._engine.start()
+        self.finalScores[:] = 0
+        return self._observe(), self._engine.legalMoves()
+
+    def step(self, actions):
+        """ play one action per game, and return the observations, rewards, done flags and legal actions masks
+
+        the games that are over after this step are restarted: their observation is the one of the new game,
+        their reward and final score being the ones of the game that just finished
+        """
+        before = self._engine.score.copy()
+        changed, dones = self._engine.step(actions)
+        np.subtract(self._engine.score, before, out=self._rewards, casting='unsafe')
+
+        self.finalScores[:] = 0
+        if dones.any():
+            self.finalScores[dones] = self._engine.score[dones]
+            self._engine.start(dones)
+        return self._observe(), self._rewards, dones, self._engine.legalMoves()
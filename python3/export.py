@@ -0,0 +1,165 @@
+#-*- coding: utf-8 -*-
+
+# streaming export of played games as training data, into chunks of memory-mapped .npy files
+#
+# each chunk holds one .npy file per field, with one row per turn:
+#   boards (squares uint8 log2 exponents before the move), moves (uint8 Move.value), rewards (int32 score gained),
+#   legal (4 bool, ordered as Move, before the move) and scores (int64 final score of the game)
+# index.json lists the chunks and their number of rows
+
+import argparse
+from collections import namedtuple
+import json
+import os
+import random
+
+import numpy as np
+
+from game2048 import Engine, Move, GRID_SIZE
+import selfplay
+
+Transition = namedtuple('Transition', 'board move reward legal done score')
+
+CHUNK_ROWS = 1 << 20
+INDEX = 'index.json'
+
+
+def _fields(size: int) -> tuple:
+    return (('boards', np.uint8, (size * size,)),
+            ('moves', np.uint8, ()),
+            ('rewards', np.int32, ()),
+            ('legal', np.bool_, (len(Move),)),
+            ('scores', np.int64, ()))
+
+
+def playTransitions(strategy, games: int, size=GRID_SIZE, engine_class=Engine, seed=None):
+    """ play the games with the strategy and yield a Transition per turn, done being set on the last one """
+    seeds = random.Random(seed)
+    for game in range(games):
+        engine = engine_class(size, seed=seeds.getrandbits(64))
+        while True:
+            legal = engine.legalMoves()
+            if not any(legal):
+                break
+            side = strategy(engine)
+            if side is None:
+                break
+            if not legal[side.value]:
+                raise ValueError(f'{side} does not modify the grid')
+            board = engine.exponents
+            score = engine.score
+            engine.move(side)
+            engine.newGridItem()
+            done = engine.testEnd()
+            yield Transition(board, side, engine.score - score, legal, done, engine.score)
+
+
+class TransitionWriter(object):
+    """ write transitions into preallocated chunks of memory-mapped .npy files
+
+    the final score of a game is written back on all its rows when its last transition arrives,
+    a game left unfinished when the writer is closed is dropped
+    """
+    def __init__(self, directory: str, size=GRID_SIZE, chunk_rows=CHUNK_ROWS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.gridSize = size
+        self.chunkRows = chunk_rows
+        self._chunks = []  # rows of the closed chunks
+        self._chunk = None
+        self._row = 0
+        self._game = []  # (chunk number, chunk, first row) of the rows of the current game
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open(self):
+        index = len(self._chunks)
+        self._chunk = {name: np.lib.format.open_memmap(os.path.join(self.directory, f'{name}-{index:05d}.npy'),
+                                                       mode='w+', dtype=dtype, shape=(self.chunkRows,) + shape)
+                       for name, dtype, shape in _fields(self.gridSize)}
+        self._row = 0
+
+    def _closeChunk(self, rows: int):
+        for array in self._chunk.values():
+            array.flush()
+        self._chunks.append(rows)
+        self._chunk = None
+
+    def write(self, transition: Transition):
+        if self._chunk is None:
+            self._open()
+        if not self._game or self._game[-1][1] is not self._chunk:
+            self._game.append((len(self._chunks), self._chunk, self._row))
+
+        chunk, row = self._chunk, self._row
+        chunk['boards'][row] = np.frombuffer(transition.board, dtype=np.uint8)
+        chunk['moves'][row] = transition.move.value
+        chunk['rewards'][row] = transition.reward
+        chunk['legal'][row] = transition.legal
+        self._row += 1
+
+        if transition.done:
+            for number, gameChunk, first in self._game:
+                last = self._row if gameChunk is self._chunk else self.chunkRows
+                gameChunk['scores'][first:last] = transition.score
+            self._game = []
+        if self._row == self.chunkRows:
+            self._closeChunk(self.chunkRows)
+
+    def close(self) -> int:
+        """ flush the data, write the index and return the number of rows written """
+        if self._chunk is not None:
+            self._closeChunk(self._row)
+        if self._game:
+            # drop the rows of the unfinished game
+            for number, gameChunk, first in self._game:
+                self._chunks[number] = first
+            self._game = []
+        with open(os.path.join(self.directory, INDEX), 'w') as file:
+            json.dump({'size': self.gridSize, 'fields': [name for name, dtype, shape in _fields(self.gridSize)],
+                       'chunks': self._chunks}, file)
+        return sum(self._chunks)
+
+
+def export(directory: str, transitions, size=GRID_SIZE, chunk_rows=CHUNK_ROWS) -> int:
+    """ write the transitions of a generator and return the number of rows written """
+    writer = TransitionWriter(directory, size, chunk_rows)
+    try:
+        for transition in transitions:
+            writer.write(transition)
+    finally:
+        rows = writer.close()
+    return rows
+
+
+def load(directory: str):
+    """ yield each chunk of an export as a dict of read-only memory-mapped arrays """
+    with open(os.path.join(directory, INDEX)) as file:
+        index = json.load(file)
+    for number, rows in enumerate(index['chunks']):
+        yield {name: np.load(os.path.join(directory, f'{name}-{number:05d}.npy'), mmap_mode='r')[:rows]
+               for name in index['fields']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='play 2048 games and export their turns as training data')
+    parser.add_argument('directory')
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('-s', '--size', type=int, default=GRID_SIZE)
+    parser.add_argument('--strategy', choices=('random', 'expectimax', 'montecarlo'), default='random')
+    parser.add_argument('--budget', type=float, default=0.01, help='search time budget per move in seconds')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--chunk', type=int, default=CHUNK_ROWS, help='rows per chunk')
+    args = parser.parse_args(argv)
+
+    transitions = playTransitions(selfplay.makeStrategy(args.strategy, args.budget), args.games, args.size,
+                                  seed=args.seed)
+    print(export(args.directory, transitions, args.size, args.chunk), 'rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,25 +2,42 @@
 
 #clone of the 2048 game
 
+# game core, importable without Qt: the Qt interface (gui.py) is only loaded when the game is launched
+
 __app_name__ = '2048'
 __version__ = '1.0'
 __author__ = 'clsergent'
 __license__ = 'EUPL 1.2'
 
 import sys
-from PySide2 import QtGui, QtCore, QtWidgets
+from array import array
+from collections import namedtuple
+from collections.abc import Set
+from functools import lru_cache
 import enum
 import random
-from math import cos
+import threading
+import types
 
 # Environment values
 COLOR_SEED = 100
+ICON_DELAY = 500  # minimum delay between two window icon updates, in ms
+ANIMATION_DURATION = 100  # duration of the slide and merge animation of a move, in ms
+FRAME_BUDGET = 0.016  # time a frame of the animation may take before it is cut short, in s
+HINT_BUDGET = 0.5  # time given to the search of a hint, in s
+AUTOPLAY_BUDGET = 0.05  # time given to the search of each autoplay move, in s
+METRICS_ENV = 'GAME2048_METRICS'  # when set, the metrics are enabled and dumped to the file it names
 GRID_SIZE = 4
 RATIO_2_ON_4 = 3
+SPAWN_BUFFER = 256  # number of spawns drawn at once from the engine generator
+ROW_CACHE_SIZE = 1 << 16  # rows whose move is remembered
+ZOBRIST_BITS = 64
+ZOBRIST_MASK = (1 << ZOBRIST_BITS) - 1
 
 # TEXT
 LOST_TITLE = 'You lost'
 LOST_MESSAGE = 'You lost with a score of {score}\nDo you want to play again'
+HINT_TITLE = '{title} - hint: {move}'
 ABOUT_TITLE = 'A propos'
 ABOUT_MESSAGE = f'{__app_name__}\nVersion: {__version__}\nAuthor: {__author__}\nLicense: {__license__}'
 
@@ -32,16 +49,268 @@ class Move(enum.Enum):
     DOWN = 3
 
 
+# a square moved by the engine: (x, y) source and destination, value before the move, and whether it merged
+# (the source is None for a spawned square)
+TileMove = namedtuple('TileMove', 'source destination value merged')
+
+
+@lru_cache(maxsize=None)
+def _gridLines(size: int, side: Move) -> tuple:
+    """ return a (slice, indexes) pair for each line of a flat grid, read in the direction its squares slide to """
+    indexes = range(size * size)
+    if side is Move.LEFT:
+        lines = [slice(y * size, (y + 1) * size) for y in range(size)]
+    elif side is Move.RIGHT:
+        lines = [slice((y + 1) * size - 1, y * size - 1 if y else None, -1) for y in range(size)]
+    elif side is Move.UP:
+        lines = [slice(x, None, size) for x in range(size)]
+    else:
+        lines = [slice(x + size * (size - 1), x - 1 if x else None, -size) for x in range(size)]
+    return tuple((line, indexes[line]) for line in lines)
+
+
+@lru_cache(maxsize=None)
+def _symmetries(size: int) -> tuple:
+    """ the 8 rotations and reflections of a flat grid, each one giving the index every square is moved to """
+    last = size - 1
+    maps = (lambda x, y: (x, y), lambda x, y: (last - y, x), lambda x, y: (last - x, last - y),
+            lambda x, y: (y, last - x), lambda x, y: (last - x, y), lambda x, y: (x, last - y),
+            lambda x, y: (y, x), lambda x, y: (last - y, last - x))
+    return tuple(tuple(y * size + x for x, y in (transform(i % size, i // size) for i in range(size * size)))
+                 for transform in maps)
+
+
+# Zobrist values of the squares, by (grid size, exponent): row[index] packs, for each of the 8 symmetries,
+# the 64-bit value of the square the index is moved to, ZOBRIST_BITS bits each (the empty squares are 0)
+_zobristRows = {}
+_zobristLock = threading.Lock()
+
+
+def _zobristRow(size: int, exponent: int) -> tuple:
+    """ return the Zobrist values of the squares of an exponent, computed once for all the threads """
+    row = _zobristRows.get((size, exponent))
+    if row is None:
+        with _zobristLock:
+            row = _zobristRows.get((size, exponent))
+            if row is None:
+                if exponent == 0:
+                    row = (0,) * (size * size)
+                else:
+                    rng = random.Random(f'zobrist {size} {exponent}')
+                    values = [rng.getrandbits(ZOBRIST_BITS) for i in range(size * size)]
+                    row = tuple(sum(values[symmetry[index]] << (ZOBRIST_BITS * i)
+                                    for i, symmetry in enumerate(_symmetries(size))) for index in range(size * size))
+                _zobristRows[(size, exponent)] = row
+    return row
+
+
+def boardHashes(exponents, size: int) -> int:
+    """ return the packed Zobrist hashes of row-major exponents under the 8 symmetries """
+    rows = {}
+    hashes = 0
+    for index, exponent in enumerate(exponents):
+        if exponent:
+            row = rows.get(exponent)
+            if row is None:
+                row = rows[exponent] = _zobristRow(size, exponent)
+            hashes ^= row[index]
+    return hashes
+
+
+@lru_cache(maxsize=ROW_CACHE_SIZE)
+def _transformRow(row: bytes):
+    """ slide and merge a line of exponents toward its start, return the slid line, the merged line,
+    the score gained, whether the line changed and the (source, destination, merged) positions of the squares
+    which moved or merged """
+    cells = row.replace(b'\0', b'')
+    positions = [i for i in range(len(row)) if row[i]]
+    merged = bytearray()
+    targets = []
+    gain = 0
+    i = 0
+    while i < len(cells):
+        if i + 1 < len(cells) and cells[i] == cells[i + 1]:
+            targets.append((positions[i], len(merged), True))
+            targets.append((positions[i + 1], len(merged), True))
+            merged.append(cells[i] + 1)
+            gain += 2 << cells[i]
+            i += 2
+        else:
+            if positions[i] != len(merged):
+                targets.append((positions[i], len(merged), False))
+            merged.append(cells[i])
+            i += 1
+    merged += bytes(len(row) - len(merged))
+    return cells + bytes(len(row) - len(cells)), bytes(merged), gain, merged != row, tuple(targets)
+
+
+class _EmptySquares(Set):
+    """ read-only set of the (x, y) coordinates of the empty squares of an engine """
+    __slots__ = ('_engine',)
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    def __contains__(self, square):
+        x, y = square
+        size = self._engine.gridSize
+        return 0 <= x < size and 0 <= y < size and self._engine._emptyIndex[y * size + x] >= 0
+
+    def __iter__(self):
+        size = self._engine.gridSize
+        return ((index % size, index // size) for index in self._engine._emptySquares)
+
+    def __len__(self):
+        return len(self._engine._emptySquares)
+
+
 class Engine(object):
-    """ Game core """
-    def __init__(self, size=4):
+    """ Game core
+
+    the grid is a flat bytearray of log2 exponents (0 being an empty square), the square (x, y) being at y * size + x
+    """
+    __slots__ = ('gridSize', '_score', '_grid', '_emptySquares', '_emptyIndex', '_histogram', '_maxTile',
+                 '_changed', '_lastSpawn', '_rng', '_draws', '_drawIndex', '_hashes', '_zobrist')
+
+    def __init__(self, size=4, seed=None, rng=None, hashing=False):
+        """ rng is an optional random.Random-like generator, seeded with seed otherwise: its getrandbits draws the
+        spawns, its seed is only called by reseed and start(seed); with hashing, the Zobrist hashes are maintained as
+        the squares change instead of computed when read """
         self.gridSize = size
+        self._zobrist = [] if hashing else None  # Zobrist rows used by the engine, by exponent
+        self._rng = random.Random(seed) if rng is None else rng
+        self._draws = array('I')
+        self._drawIndex = 0
         self.start()
 
+    def reseed(self, seed):
+        """ restart the engine generator from the given seed, discarding the values drawn in advance """
+        self._rng.seed(seed)
+        self._draws = array('I')
+        self._drawIndex = 0
+
+    def _drawSpawn(self, choices: int):
+        """ return the position of a new square among choices empty squares, and its exponent """
+        if self._drawIndex == len(self._draws):
+            # draw the 32 bits values of SPAWN_BUFFER spawns with a single call to the generator
+            bits = self._rng.getrandbits(64 * SPAWN_BUFFER)
+            self._draws = array('I', bits.to_bytes(8 * SPAWN_BUFFER, 'little'))
+            if sys.byteorder != 'little':
+                self._draws.byteswap()
+            self._drawIndex = 0
+        position = (self._draws[self._drawIndex] * choices) >> 32
+        four = (self._draws[self._drawIndex + 1] * (RATIO_2_ON_4 + 1)) >> 32 == 0
+        self._drawIndex += 2
+        return position, 2 if four else 1
+
     @property
     def score(self):
         return self._score
 
+    @property
+    def exponents(self) -> bytes:
+        """ copy of the row-major log2 exponents of the squares """
+        return bytes(self._grid)
+
+    @property
+    def lastSpawn(self):
+        """ (x, y, value) of the square added by the last newGridItem call, or None """
+        if self._lastSpawn is None:
+            return None
+        index, exponent = self._lastSpawn
+        return index % self.gridSize, index // self.gridSize, 1 << exponent
+
+    @property
+    def emptyCells(self):
+        """ read-only set-like view of the (x, y) coordinates of the empty squares """
+        return _EmptySquares(self)
+
+    @property
+    def maxTile(self) -> int:
+        return self._maxTile
+
+    @property
+    def histogram(self):
+        """ read-only mapping of each square value on the grid to its number of occurrences """
+        return types.MappingProxyType(self._histogram)
+
+    def _boardHashes(self) -> int:
+        if self._zobrist is None:
+            return boardHashes(self._grid, self.gridSize)
+        return self._hashes
+
+    @property
+    def zobrist(self) -> int:
+        """ 64-bit Zobrist hash of the grid """
+        return self._boardHashes() & ZOBRIST_MASK
+
+    @property
+    def canonicalKey(self) -> int:
+        """ 64-bit hash shared by the grid and its rotations and reflections """
+        hashes = self._boardHashes()
+        return min((hashes >> (ZOBRIST_BITS * i)) & ZOBRIST_MASK for i in range(8))
+
+    def popChangedCells(self) -> set:
+        """ return the (x, y) coordinates of the squares modified since the last call
+        (a square modified and then restored within a move is reported as well) """
+        changed, self._changed = self._changed, set()
+        if changed is None:
+            # the whole grid was reset
+            return {(x, y) for x in range(self.gridSize) for y in range(self.gridSize)}
+        return {(index % self.gridSize, index // self.gridSize) for index in changed}
+
+    def _track(self, index: int, old: int, exponent: int):
+        """ update the empty squares, max tile, histogram and hashes for a single modified square """
+        zobrist = self._zobrist
+        if zobrist is not None:
+            top = max(old, exponent)
+            if len(zobrist) <= top:
+                # first square of this value since the engine was started or loaded
+                zobrist.extend(_zobristRow(self.gridSize, row) for row in range(len(zobrist), top + 1))
+            self._hashes ^= zobrist[old][index] ^ zobrist[exponent][index]
+        if old == 0:
+            # swap the square with the last empty one to remove it in constant time
+            position = self._emptyIndex[index]
+            last = self._emptySquares.pop()
+            if last != index:
+                self._emptySquares[position] = last
+                self._emptyIndex[last] = position
+            self._emptyIndex[index] = -1
+        else:
+            old = 1 << old
+            self._histogram[old] -= 1
+            if self._histogram[old] == 0:
+                del self._histogram[old]
+
+        if exponent == 0:
+            self._emptyIndex[index] = len(self._emptySquares)
+            self._emptySquares.append(index)
+            value = 0
+        else:
+            value = 1 << exponent
+            self._histogram[value] = self._histogram.get(value, 0) + 1
+
+        if value > self._maxTile:
+            self._maxTile = value
+        elif old == self._maxTile and old not in self._histogram:
+            self._maxTile = max(self._histogram, default=0)
+
+    def _setSquare(self, index: int, exponent: int):
+        old = self._grid[index]
+        if old != exponent:
+            self._grid[index] = exponent
+            self._track(index, old, exponent)
+            if self._changed is not None:
+                self._changed.add(index)
+
+    def _setLine(self, line: slice, indexes: range, old: bytes, new: bytes):
+        for i in range(len(old)):
+            if old[i] != new[i]:
+                self._track(indexes[i], old[i], new[i])
+                if self._changed is not None:
+                    self._changed.add(indexes[i])
+        self._grid[line] = new
+
     def _compose(self, x: int, y: int, side: Move):
         if side is None or side is Move.LEFT:
             return x, y
@@ -56,253 +325,216 @@ class Engine(object):
         x, y = self._compose(x, y, side)
 
         if (0 <= x <= self.gridSize - 1) and (0 <= y <= self.gridSize - 1):
-            return self._grid[x][y]
+            exponent = self._grid[y * self.gridSize + x]
+            return 1 << exponent if exponent else 0
         raise OverflowError
     
     def setGridItem(self, x, y, value: int, side=None):
         x, y = self._compose(x, y, side)
 
         if (0 <= x <= self.gridSize - 1) and (0 <= y <= self.gridSize - 1):
-            self._grid[x][y]= value
+            if value and (value < 2 or value & (value - 1)):
+                raise ValueError(f'{value} is not a power of 2')
+            self._setSquare(y * self.gridSize + x, value.bit_length() - 1 if value else 0)
         else:
             raise OverflowError
             
-    def newGridItem(self):
-        """ add a new square"""
-        empty_squares = []
-
-        for x in range(self.gridSize):
-            for y in range(self.gridSize):
-                square= self.getGridItem(x, y)
-                if square == 0:
-                    empty_squares.append((x,y))
-
-        if len(empty_squares) > 0:
-            square = random.choice(empty_squares)
-            self.setGridItem(square[0], square[1], random.choice((2,) * RATIO_2_ON_4 + (4,)))
+    def _tileMoves(self, indexes: range, row, targets, transitions: list):
+        """ append to transitions the TileMove of each (source, destination, merged) position of a line """
+        size = self.gridSize
+        for source, destination, merged in targets:
+            value = 1 << row[source]
+            source, destination = indexes[source], indexes[destination]
+            transitions.append(TileMove((source % size, source // size), (destination % size, destination // size),
+                                        value, merged))
+
+    def newGridItem(self, transitions=None):
+        """ add a new square, appending its TileMove to the optional transitions list """
+        if len(self._emptySquares) > 0:
+            position, exponent = self._drawSpawn(len(self._emptySquares))
+            index = self._emptySquares[position]
+            self._setSquare(index, exponent)
+            self._lastSpawn = index, exponent
+            if transitions is not None:
+                transitions.append(TileMove(None, (index % self.gridSize, index // self.gridSize), 1 << exponent,
+                                            False))
             return True
         else:
+            self._lastSpawn = None
             return False
     
-    def start(self):
+    def start(self, seed=None):
+        if seed is not None:
+            self.reseed(seed)
+        squares = self.gridSize * self.gridSize
         self._score = 0
-        self._grid = [[0] * self.gridSize for i in range(self.gridSize)]
+        self._grid = bytearray(squares)
+        self._emptySquares = array('i', range(squares))
+        self._emptyIndex = array('i', range(squares))
+        self._histogram = {}
+        self._maxTile = 0
+        self._hashes = 0
+        self._changed = None  # every square
         self.newGridItem()
 
+    def load(self, exponents: bytes, score=0, empty=None):
+        """ replace the grid by row-major log2 exponents and set the score, the generator is left untouched
+
+        empty is the order of the indexes of the empty squares, which decides where the next squares spawn
+        (increasing by default)
+        """
+        squares = self.gridSize * self.gridSize
+        if len(exponents) != squares:
+            raise ValueError(f'{len(exponents)} squares given for a {self.gridSize}x{self.gridSize} grid')
+        self._score = score
+        self._grid = bytearray(exponents)
+        if empty is None:
+            empty = [index for index in range(squares) if self._grid[index] == 0]
+        elif sorted(empty) != [index for index in range(squares) if self._grid[index] == 0]:
+            raise ValueError('empty does not list the empty squares')
+        self._emptySquares = array('i', empty)
+        self._emptyIndex = array('i', [-1]) * squares
+        for position, index in enumerate(empty):
+            self._emptyIndex[index] = position
+        self._histogram = {}
+        for exponent in self._grid:
+            if exponent:
+                self._histogram[1 << exponent] = self._histogram.get(1 << exponent, 0) + 1
+        self._maxTile = max(self._histogram, default=0)
+        self._hashes = boardHashes(self._grid, self.gridSize) if self._zobrist is not None else 0
+        self._changed = None
+        self._lastSpawn = None
+
     def testEnd(self):
-        # test whether the game is over or not (which happens if no 0 remains)
-        for move in Move:
-            if self.moveGridItems(move, apply=False) or self.sumGridItems(move, apply=False):
-                return False
-        return True
+        # test whether the game is over or not (which happens if no move can modify the grid)
+        return not any(self.legalMoves())
+
+    def legalMoves(self) -> tuple:
+        """ return whether each side would modify the grid, ordered as Move, without modifying anything """
+        left = right = up = down = False
+        size = self.gridSize
+        last = size - 1
+        grid = self._grid
+        for y in range(size):
+            for index in range(y * size, (y + 1) * size):
+                value = grid[index]
+                if index % size < last:
+                    other = grid[index + 1]
+                    if value == 0:
+                        left = left or other != 0
+                    elif other == 0:
+                        right = True
+                    elif other == value:
+                        left = right = True
+                if y < last:
+                    other = grid[index + size]
+                    if value == 0:
+                        up = up or other != 0
+                    elif other == 0:
+                        down = True
+                    elif other == value:
+                        up = down = True
+            if left and right and up and down:
+                break
+        return left, right, up, down
     
-    def moveGridItems(self, side, apply=True):
-        """ move items depending on the side, and return whether the grid was modified or not """
+    def moveGridItems(self, side, apply=True, transitions=None):
+        """ move items depending on the side, and return whether the grid was modified or not
+
+        the TileMove of each moved square is appended to the optional transitions list when the move is applied
+        """
+        side = side or Move.LEFT  # None is LEFT, as for getGridItem
         touched= False
-        for y in range(self.gridSize):
-            row = list()
-            for x in range(self.gridSize):
-                row.append(self.getGridItem(x, y, side))
-            oldRow = list(row)
-            while 0 in row:
-                row.remove(0)
-            row += [0]*(self.gridSize - len(row))
-            
+        for line, indexes in _gridLines(self.gridSize, side):
+            oldRow = self._grid[line]
+            row = oldRow.replace(b'\0', b'')
+            row += bytes(self.gridSize - len(row))
+
             if oldRow != row:
                 touched= True
-
-            if apply is True:
-                for x in range(self.gridSize):
-                    self.setGridItem(x, y, row[x], side)
+                if apply is True:
+                    if transitions is not None:
+                        positions = [i for i in range(len(oldRow)) if oldRow[i]]
+                        self._tileMoves(indexes, oldRow, [(source, destination, False)
+                                                          for destination, source in enumerate(positions)
+                                                          if source != destination], transitions)
+                    self._setLine(line, indexes, oldRow, row)
         return touched
                 
-    def sumGridItems(self, side, apply=True):
-        """ sum identical squares depending on the side, and return whether the grid was modified or not """
+    def move(self, side: Move, transitions=None):
+        """ slide and merge items in a single step, and return whether the grid was modified or not
+
+        the result of each line is looked up in a cache shared by the engines, the lines of real games repeating a lot;
+        the TileMove of each moved or merged square is appended to the optional transitions list
+        """
+        side = side or Move.LEFT
+        lines = []
+        for line, indexes in _gridLines(self.gridSize, side):
+            oldRow = self._grid[line]
+            slid, merged, gain, changed, targets = _transformRow(bytes(oldRow))
+            if changed:
+                lines.append((line, indexes, oldRow, slid, merged))
+                self._score += gain
+                if transitions is not None:
+                    self._tileMoves(indexes, oldRow, targets, transitions)
+        # the squares are updated in the same order as by moveGridItems and sumGridItems,
+        # which keeps the order of the empty squares, and so the next spawns, identical
+        for line, indexes, oldRow, slid, merged in lines:
+            if slid != oldRow:
+                self._setLine(line, indexes, oldRow, slid)
+        for line, indexes, oldRow, slid, merged in lines:
+            if merged != slid:
+                self._setLine(line, indexes, slid, merged)
+        return bool(lines)
+
+    def sumGridItems(self, side, apply=True, transitions=None):
+        """ sum identical squares depending on the side, and return whether the grid was modified or not
+
+        the TileMove of each moved or merged square is appended to the optional transitions list when the sum is
+        applied
+        """
+        side = side or Move.LEFT
         touched = False
-        for y in range(self.gridSize):
-            row = list()
-            for x in range(self.gridSize):
-                row.append(self.getGridItem(x, y, side))
-
-            oldRow= [i for i in row]
+        for line, indexes in _gridLines(self.gridSize, side):
+            oldRow = self._grid[line]
+            row = list(oldRow)
+            origins = list(range(len(row)))  # position in oldRow of each square of row
+            targets = []
+            gain = 0
             xx = 0
             while xx < len(row)-1:
                 if row[xx] == row[xx+1]:
-                    row[xx] *= 2
+                    if row[xx]:
+                        row[xx] += 1
+                        gain += 1 << row[xx]
+                        targets.append((origins[xx + 1], xx, True))
                     row.pop(xx + 1)
-                    self._score += row[xx]
+                    origins.pop(xx + 1)
                 xx += 1
-            
-            row+=[0]*(self.gridSize - len(row))
+
+            row = bytes(row + [0]*(self.gridSize - len(row)))
             if oldRow != row:
                 touched= True
-
-            if apply is True:
-                for x in range(self.gridSize):
-                    self.setGridItem(x, y, row[x], side)
+                if apply is True:
+                    if transitions is not None:
+                        merged = {destination for source, destination, flag in targets}
+                        targets += [(origin, destination, destination in merged)
+                                    for destination, origin in enumerate(origins)
+                                    if oldRow[origin] and (origin != destination or destination in merged)]
+                        self._tileMoves(indexes, oldRow, sorted(targets), transitions)
+                    self._setLine(line, indexes, oldRow, row)
+                    self._score += gain
         return touched
 
 
-class Square(QtWidgets.QGraphicsItem):
-    """ A graphic square """
-    def __init__(self, parent: QtWidgets.QGraphicsView, x: int, y: int):
-        QtWidgets.QGraphicsItem.__init__(self)
-        self.parent= parent
-        self.x = x
-        self.y = y
-        self._value = 0
-
-    @property
-    def value(self):
-        return self._value
-
-    @value.setter
-    def value(self, value):
-        self._value = value
-
-    @property
-    def color(self):
-        """ return a RGB color based on the square value"""
-        # return int(abs(cos(value) * 256**3) + abs(sin(value+seed) * 256**2) + abs(tan(value+seed) * 256))
-        return int(abs(cos(self.value + COLOR_SEED) * 256 ** 3))
-        
-    def boundingRect(self):
-        size= self.parent.squareSize()
-        return QtCore.QRectF(self.x*size[0], self.y*size[1], size[0], size[1])
-
-    def innerRect(self):
-        size = self.parent.squareSize()
-        return QtCore.QRectF(self.x * size[0]+2, self.y * size[1]+2, size[0]-2, size[1]-2)
-
-    def paint(self, painter, option, widget):
-        size = self.parent.squareSize()
-        # paint the square
-        painter.setOpacity(0.5)
-        painter.setBrush(QtGui.QColor(self.color))
-        painter.setCompositionMode(QtGui.QPainter.CompositionMode_SourceOver)
-        painter.drawRoundedRect(self.innerRect(), 10, 10)
-
-        # paint text
-        painter.setOpacity(1)
-        painter.setFont(QtGui.QFont("Arial", (size[0] + size[1])//6))
-        painter.drawText(self.x * size[0] + 1, self.y * size[1] + 1,
-                         size[0] - 1, size[1] - 1,
-                         QtCore.Qt.AlignCenter, str(self.value))
-
-
-class Frame(QtWidgets.QGraphicsView):
-    """ Game main window """
-    def __init__(self, parent=None, scene=None, grid_size=4):
-        QtWidgets.QGraphicsView.__init__(self, parent)
-        # attributes
-        self.application = QtWidgets.QApplication.instance()
-        self.scene= QtWidgets.QGraphicsScene()
-        self.setScene(self.scene)
-        self.engine = Engine(grid_size)
-        self.squares = [[Square] * self.engine.gridSize for i in range(self.engine.gridSize)]
-
-        for x in range(self.engine.gridSize):
-            for y in range(self.engine.gridSize):
-                self.squares[x][y]= Square(self, x, y)
-                self.scene.addItem(self.squares[x][y])
-
-        # window settings
-        self.setWindowFlags(QtCore.Qt.Window)
-        self.setAttribute(QtCore.Qt.WA_TranslucentBackground)
-        self.setAttribute(QtCore.Qt.WA_NoSystemBackground)
-        #self.setStyleSheet('background-color: transparent;')
-        self.setBackgroundBrush(QtGui.QColor(QtCore.Qt.transparent))
-        self.setRenderHint(QtGui.QPainter.Antialiasing)
-        self.setWindowTitle("2048")
-
-        # layout and scrollbars
-        self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
-        self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
-        self.setAlignment(QtCore.Qt.AlignLeft|QtCore.Qt.AlignTop)
-
-        # size
-        self.setMinimumSize(100*self.engine.gridSize,75*self.engine.gridSize)
-        self.resize(100*self.engine.gridSize,75*self.engine.gridSize)
-
-        # Action settings
-        self._menuBar = QtWidgets.QMenuBar(self)
-        self._fileMenu = self._menuBar.addMenu('&File')
-        self._aboutAction = QtWidgets.QAction('&About', self)
-        self._aboutAction.triggered.connect(self.about)
-        self._fileMenu.addAction(self._aboutAction)
-        
-        self._up= QtWidgets.QAction(self)
-        self._up.setShortcut('Up')
-        self._up.triggered.connect(lambda: self.move(Move.UP))
-        self.addAction(self._up)
-        
-        self._down= QtWidgets.QAction(self)
-        self._down.setShortcut('Down')
-        self._down.triggered.connect(lambda: self.move(Move.DOWN))
-        self.addAction(self._down)
-        
-        self._left= QtWidgets.QAction(self)
-        self._left.setShortcut('Left')
-
-        self._left.triggered.connect(lambda: self.move(Move.LEFT))
-        self.addAction(self._left)
-        
-        self._right= QtWidgets.QAction(self)
-        self._right.setShortcut('Right')
-        self._right.triggered.connect(lambda: self.move(Move.RIGHT))
-        self.addAction(self._right)
-
-        self.update()
-        self.show()
-
-    def update(self):
-        for x in range(self.engine.gridSize):
-            for y in range(self.engine.gridSize):
-                self.squares[x][y].value = self.engine.getGridItem(x, y)
-        self.scene.update()
-        self.updateIcon()
-        self.application.sendPostedEvents()
-        self.application.processEvents()
-        self.scene.update()
-
-    def updateTitle(self):
-        if self.engine.score > 0:
-            self.setWindowTitle("2048 - %i" % self.engine.score)
-        else:
-            self.setWindowTitle("2048")
-
-    def updateIcon(self):
-        px = self.grab(self.rect())
-        self.application.setWindowIcon(QtGui.QIcon(px))
-    
-    def squareSize(self):
-        """ return the graphic size of a square """
-        return self.width() // self.engine.gridSize, self.height() // self.engine.gridSize
-    
-    def move(self, side: Move):
-        """ move the elements according to the given side """
-        if self.engine.moveGridItems(side) | self.engine.sumGridItems(side):
-            self.engine.newGridItem()
-
-        if self.engine.testEnd():
-            reply = QtWidgets.QMessageBox.information(self,LOST_TITLE, LOST_MESSAGE.format(score=self.engine.score),
-                                                      QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No,
-                                                      QtWidgets.QMessageBox.Yes)
-
-            if reply == QtWidgets.QMessageBox.Yes:
-                self.engine.start()
-            else:
-                self.application.quit()
-        self.updateTitle()
-
-        self.update()
-    
-    def about(self, event= None) -> None:
-        """  provide information about the application """
-        QtWidgets.QMessageBox.about(self, ABOUT_TITLE, ABOUT_MESSAGE)
+def __getattr__(name):
+    # the Qt classes are still reachable from here, but only imported on first use
+    if name in ('Square', 'Frame'):
+        import gui
+        return getattr(gui, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 if __name__ == '__main__':
-    app = QtWidgets.QApplication(sys.argv)
-    w= Frame(grid_size=GRID_SIZE)
-    sys.exit(app.exec_())
+    import gui
+    gui.main()
@@ -0,0 +1,441 @@
+#-*- coding: utf-8 -*-
+
+# Qt interface of the game
+
+from collections import namedtuple
+import os
+import sys
+import threading
+import time
+from PySide2 import QtGui, QtCore, QtWidgets
+from math import cos
+
+from game2048 import (Engine, Move, COLOR_SEED, ICON_DELAY, ANIMATION_DURATION, FRAME_BUDGET, HINT_BUDGET,
+                      AUTOPLAY_BUDGET, METRICS_ENV, GRID_SIZE, LOST_TITLE, LOST_MESSAGE, HINT_TITLE, ABOUT_TITLE,
+                      ABOUT_MESSAGE)
+from ai import ExpectimaxPlayer
+
+# copy of the grid searched by a worker, the player only reads the grid size and the exponents
+_Snapshot = namedtuple('_Snapshot', 'gridSize exponents')
+
+
+class Square(QtWidgets.QGraphicsItem):
+    """ A graphic square """
+    __slots__ = ('parent', 'x', 'y', '_value')
+
+    # pre-rendered tiles, by (value, square size, device pixel ratio)
+    _pixmaps = {}
+
+    def __init__(self, parent: QtWidgets.QGraphicsView, x: int, y: int):
+        QtWidgets.QGraphicsItem.__init__(self)
+        self.parent= parent
+        self.x = x
+        self.y = y
+        self._value = 0
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if value != self._value:
+            self._value = value
+            self.update()
+
+    @staticmethod
+    def colorOf(value: int) -> int:
+        """ return a RGB color based on a square value"""
+        # return int(abs(cos(value) * 256**3) + abs(sin(value+seed) * 256**2) + abs(tan(value+seed) * 256))
+        return int(abs(cos(value + COLOR_SEED) * 256 ** 3))
+
+    @property
+    def color(self):
+        """ return a RGB color based on the square value"""
+        return self.colorOf(self.value)
+        
+    def boundingRect(self):
+        size= self.parent.squareSize()
+        return QtCore.QRectF(self.x*size[0], self.y*size[1], size[0], size[1])
+
+    def innerRect(self):
+        size = self.parent.squareSize()
+        return QtCore.QRectF(self.x * size[0]+2, self.y * size[1]+2, size[0]-2, size[1]-2)
+
+    @classmethod
+    def clearCache(cls):
+        """ drop the pre-rendered tiles, to be called when the square size changes """
+        cls._pixmaps.clear()
+
+    @classmethod
+    def renderTile(cls, value: int, size: tuple, ratio: float) -> QtGui.QPixmap:
+        """ draw a square of the given value on a transparent pixmap of the given size and device pixel ratio """
+        pixmap = QtGui.QPixmap(int(size[0] * ratio), int(size[1] * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(QtCore.Qt.transparent)
+
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        # paint the square
+        painter.setOpacity(0.5)
+        painter.setBrush(QtGui.QColor(cls.colorOf(value)))
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_SourceOver)
+        painter.drawRoundedRect(QtCore.QRectF(2, 2, size[0] - 2, size[1] - 2), 10, 10)
+
+        # paint text
+        painter.setOpacity(1)
+        painter.setFont(QtGui.QFont("Arial", (size[0] + size[1])//6))
+        painter.drawText(1, 1, size[0] - 1, size[1] - 1, QtCore.Qt.AlignCenter, str(value))
+        painter.end()
+        return pixmap
+
+    @classmethod
+    def tile(cls, value: int, size: tuple, ratio: float) -> QtGui.QPixmap:
+        """ return the pre-rendered square of the given value, size and device pixel ratio """
+        key = (value, size, ratio)
+        pixmap = cls._pixmaps.get(key)
+        if pixmap is None:
+            pixmap = cls._pixmaps[key] = cls.renderTile(value, size, ratio)
+        return pixmap
+
+    def paint(self, painter, option, widget):
+        size = self.parent.squareSize()
+        painter.drawPixmap(self.x * size[0], self.y * size[1],
+                           self.tile(self.value, size, painter.device().devicePixelRatioF()))
+
+
+class _TileLayer(QtWidgets.QGraphicsItem):
+    """ squares moving during an animation, all drawn by this single item above the grid
+
+    only the paths of the moving squares are repainted, so that the still squares of large grids are left alone
+    """
+    def __init__(self, parent: QtWidgets.QGraphicsView):
+        QtWidgets.QGraphicsItem.__init__(self)
+        self.parent = parent
+        self.tiles = []  # (value, source (x, y), destination (x, y)) of the moving squares
+        self.progress = 0.
+        self._paths = []  # rectangle covered by each moving square from its source to its destination
+        self._bounds = QtCore.QRectF()
+        self.setZValue(1)
+
+    def setTiles(self, tiles: list):
+        self.prepareGeometryChange()
+        self.tiles = tiles
+        width, height = self.parent.squareSize()
+        self._paths = [QtCore.QRectF(min(x, toX) * width, min(y, toY) * height,
+                                     (abs(toX - x) + 1) * width, (abs(toY - y) + 1) * height)
+                       for value, (x, y), (toX, toY) in tiles]
+        self._bounds = QtCore.QRectF()
+        for path in self._paths:
+            self._bounds = self._bounds.united(path)
+
+    def refresh(self):
+        """ schedule the repaint of the paths of the moving squares """
+        for path in self._paths:
+            self.update(path)
+
+    def boundingRect(self):
+        return self._bounds
+
+    def paint(self, painter, option, widget):
+        size = self.parent.squareSize()
+        ratio = painter.device().devicePixelRatioF()
+        progress = self.progress
+        for value, (x, y), (toX, toY) in self.tiles:
+            painter.drawPixmap(QtCore.QPointF((x + (toX - x) * progress) * size[0],
+                                              (y + (toY - y) * progress) * size[1]),
+                               Square.tile(value, size, ratio))
+
+
+class _SearchSignals(QtCore.QObject):
+    # generation of the search, and the Move found (None when the game is over)
+    found = QtCore.Signal(int, object)
+
+
+class _Search(QtCore.QRunnable):
+    """ search of a move, run by a worker thread of the frame pool """
+    def __init__(self, player: ExpectimaxPlayer, snapshot: _Snapshot, generation: int, signals: _SearchSignals,
+                 cancelled: threading.Event):
+        QtCore.QRunnable.__init__(self)
+        self.player = player
+        self.snapshot = snapshot
+        self.generation = generation
+        self.signals = signals
+        self.cancelled = cancelled
+
+    def run(self):
+        self.signals.found.emit(self.generation, self.player.bestMove(self.snapshot, self.cancelled))
+
+
+class Frame(QtWidgets.QGraphicsView):
+    """ Game main window """
+    def __init__(self, parent=None, scene=None, grid_size=4):
+        QtWidgets.QGraphicsView.__init__(self, parent)
+        # attributes
+        self.application = QtWidgets.QApplication.instance()
+        self.scene= QtWidgets.QGraphicsScene()
+        self.setScene(self.scene)
+        self.engine = Engine(grid_size)
+        self.squares = [[Square] * self.engine.gridSize for i in range(self.engine.gridSize)]
+
+        for x in range(self.engine.gridSize):
+            for y in range(self.engine.gridSize):
+                self.squares[x][y]= Square(self, x, y)
+                self.scene.addItem(self.squares[x][y])
+        self._layer = _TileLayer(self)
+        self.scene.addItem(self._layer)
+
+        # the slides and merges of a move are shown by a single timeline, the squares they involve being updated
+        # once it is over
+        self._animation = QtCore.QVariantAnimation(self)
+        self._animation.setStartValue(0.)
+        self._animation.setEndValue(1.)
+        self._animation.setDuration(ANIMATION_DURATION)
+        self._animation.setEasingCurve(QtCore.QEasingCurve.OutCubic)
+        self._animation.valueChanged.connect(self._animate)
+        self._animation.finished.connect(self._finishAnimation)
+        self._pending = set()  # (x, y) of the squares to update at the end of the animation
+        self._frameTime = 0.  # duration of the last repaint of the view and of the last animation step, in s
+        self._stepTime = 0.
+
+        # window settings
+        self.setWindowFlags(QtCore.Qt.Window)
+        self.setAttribute(QtCore.Qt.WA_TranslucentBackground)
+        self.setAttribute(QtCore.Qt.WA_NoSystemBackground)
+        #self.setStyleSheet('background-color: transparent;')
+        self.setBackgroundBrush(QtGui.QColor(QtCore.Qt.transparent))
+        self.setRenderHint(QtGui.QPainter.Antialiasing)
+        self.setWindowTitle("2048")
+
+        # layout and scrollbars
+        self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.setAlignment(QtCore.Qt.AlignLeft|QtCore.Qt.AlignTop)
+
+        # size
+        self.setMinimumSize(100*self.engine.gridSize,75*self.engine.gridSize)
+        self.resize(100*self.engine.gridSize,75*self.engine.gridSize)
+
+        # Action settings
+        self._menuBar = QtWidgets.QMenuBar(self)
+        self._fileMenu = self._menuBar.addMenu('&File')
+        self._aboutAction = QtWidgets.QAction('&About', self)
+        self._aboutAction.triggered.connect(self.about)
+        self._fileMenu.addAction(self._aboutAction)
+
+        self._playMenu = self._menuBar.addMenu('&Play')
+        self._hintAction = QtWidgets.QAction('&Hint', self)
+        self._hintAction.setShortcut('H')
+        self._hintAction.triggered.connect(self.hint)
+        self._playMenu.addAction(self._hintAction)
+        self._autoplayAction = QtWidgets.QAction('&Autoplay', self)
+        self._autoplayAction.setShortcut('A')
+        self._autoplayAction.setCheckable(True)
+        self._autoplayAction.toggled.connect(self.autoplay)
+        self._playMenu.addAction(self._autoplayAction)
+        
+        self._up= QtWidgets.QAction(self)
+        self._up.setShortcut('Up')
+        self._up.triggered.connect(lambda: self.move(Move.UP))
+        self.addAction(self._up)
+        
+        self._down= QtWidgets.QAction(self)
+        self._down.setShortcut('Down')
+        self._down.triggered.connect(lambda: self.move(Move.DOWN))
+        self.addAction(self._down)
+        
+        self._left= QtWidgets.QAction(self)
+        self._left.setShortcut('Left')
+
+        self._left.triggered.connect(lambda: self.move(Move.LEFT))
+        self.addAction(self._left)
+        
+        self._right= QtWidgets.QAction(self)
+        self._right.setShortcut('Right')
+        self._right.triggered.connect(lambda: self.move(Move.RIGHT))
+        self.addAction(self._right)
+
+        # the icon is a grab of the whole window: refresh it at most once per ICON_DELAY
+        self._iconTimer = QtCore.QTimer(self)
+        self._iconTimer.setSingleShot(True)
+        self._iconTimer.setInterval(ICON_DELAY)
+        self._iconTimer.timeout.connect(self.updateIcon)
+
+        # the moves are searched by a single worker thread, a search being cancelled as soon as the grid changes
+        self._searchPool = QtCore.QThreadPool(self)
+        self._searchPool.setMaxThreadCount(1)
+        self._searchSignals = _SearchSignals(self)
+        self._searchSignals.found.connect(self._searchDone)
+        self._player = ExpectimaxPlayer(HINT_BUDGET)
+        self._generation = 0  # incremented for each search, the results of the previous ones are ignored
+        self._cancelled = threading.Event()  # set to stop the last search, whether it started or not
+        self._hint = None
+
+        self.update()
+        self.show()
+
+    def update(self):
+        # only the squares modified by the engine are repainted, after the animation of the move if any
+        self._pending |= self.engine.popChangedCells()
+        if self._animation.state() != QtCore.QAbstractAnimation.Running:
+            self._showPending()
+        if not self._iconTimer.isActive():
+            self._iconTimer.start()
+
+    def _showPending(self):
+        for x, y in self._pending:
+            self.squares[x][y].value = self.engine.getGridItem(x, y)
+        self._pending.clear()
+
+    def _startAnimation(self, transitions: list):
+        """ slide the squares of the TileMove list from their source to their destination """
+        # a move coming during the animation of the previous one (key repeat, autoplay) ends it at once
+        if self._animation.state() == QtCore.QAbstractAnimation.Running:
+            self._animation.stop()
+            self._finishAnimation()
+        tiles = [(transition.value, transition.source, transition.destination) for transition in transitions
+                 if transition.source is not None]
+        if not tiles:
+            return
+        # the squares at both ends are drawn by the layer until the end of the animation
+        for value, source, destination in tiles:
+            for x, y in (source, destination):
+                self.squares[x][y].value = 0
+                self._pending.add((x, y))
+        self._layer.setTiles(tiles)
+        self._layer.progress = 0.
+        self._layer.refresh()
+        self._frameTime = self._stepTime = 0.
+        self._animation.start()
+
+    def _animate(self, progress: float):
+        # a frame costs this step and the repaint of the view it triggers (every square under the moving ones):
+        # on grids too large for a frame to fit in FRAME_BUDGET, the animation is cut short instead of slowing
+        # the game down
+        if self._frameTime + self._stepTime > FRAME_BUDGET:
+            self._animation.stop()
+            self._finishAnimation()
+            return
+        start = time.perf_counter()
+        self._layer.progress = progress
+        self._layer.refresh()
+        self._stepTime = time.perf_counter() - start
+
+    def _finishAnimation(self):
+        self._layer.refresh()
+        self._layer.setTiles([])
+        self._showPending()
+
+    def paintEvent(self, event):
+        start = time.perf_counter()
+        QtWidgets.QGraphicsView.paintEvent(self, event)
+        self._frameTime = time.perf_counter() - start
+
+    def updateTitle(self):
+        if self.engine.score > 0:
+            title = "2048 - %i" % self.engine.score
+        else:
+            title = "2048"
+        if self._hint is not None:
+            title = HINT_TITLE.format(title=title, move=self._hint.name)
+        self.setWindowTitle(title)
+
+    def updateIcon(self):
+        px = self.grab(self.rect())
+        self.application.setWindowIcon(QtGui.QIcon(px))
+    
+    def closeEvent(self, event):
+        self._cancelSearch()
+        self._searchPool.waitForDone()
+        QtWidgets.QGraphicsView.closeEvent(self, event)
+
+    def resizeEvent(self, event):
+        # the paths of the moving squares depend on the square size
+        if self._animation.state() == QtCore.QAbstractAnimation.Running:
+            self._animation.stop()
+            self._finishAnimation()
+        Square.clearCache()
+        QtWidgets.QGraphicsView.resizeEvent(self, event)
+
+    def squareSize(self):
+        """ return the graphic size of a square """
+        return self.width() // self.engine.gridSize, self.height() // self.engine.gridSize
+    
+    def _search(self, budget: float):
+        """ search the best move for the current grid in the worker thread, without waiting for it """
+        self._cancelSearch()
+        self._player.timeBudget = budget
+        self._cancelled = threading.Event()
+        self._searchPool.start(_Search(self._player, _Snapshot(self.engine.gridSize, self.engine.exponents),
+                                       self._generation, self._searchSignals, self._cancelled))
+
+    def _cancelSearch(self):
+        self._generation += 1
+        self._searchPool.clear()  # drop the search waiting for the worker, if any
+        self._cancelled.set()
+
+    def _searchDone(self, generation: int, side):
+        if generation != self._generation:
+            return
+        if self._autoplayAction.isChecked():
+            if side is not None:
+                self.move(side)
+        else:
+            self._hint = side
+            self.updateTitle()
+
+    def hint(self):
+        """ show the best move in the window title once it is found """
+        self._search(HINT_BUDGET)
+
+    def autoplay(self, enabled: bool):
+        """ play the best moves until the game is over or the autoplay is disabled """
+        if enabled:
+            self._search(AUTOPLAY_BUDGET)
+        else:
+            self._cancelSearch()
+
+    def move(self, side: Move):
+        """ move the elements according to the given side """
+        self._cancelSearch()
+        self._hint = None
+        transitions = []
+        if self.engine.move(side, transitions):
+            self.engine.newGridItem(transitions)
+        self._startAnimation(transitions)
+
+        if self.engine.testEnd():
+            reply = QtWidgets.QMessageBox.information(self,LOST_TITLE, LOST_MESSAGE.format(score=self.engine.score),
+                                                      QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No,
+                                                      QtWidgets.QMessageBox.Yes)
+
+            if reply == QtWidgets.QMessageBox.Yes:
+                self.engine.start()
+            else:
+                self.application.quit()
+        self.updateTitle()
+
+        self.update()
+        if self._autoplayAction.isChecked():
+            self._search(AUTOPLAY_BUDGET)
+    
+    def about(self, event= None) -> None:
+        """  provide information about the application """
+        QtWidgets.QMessageBox.about(self, ABOUT_TITLE, ABOUT_MESSAGE)
+
+
+def main():
+    app = QtWidgets.QApplication(sys.argv)
+    if os.environ.get(METRICS_ENV):
+        import metrics
+        metrics.enable(Engine, Frame, Square, _TileLayer)
+        metrics.startDump(os.environ[METRICS_ENV])
+    w= Frame(grid_size=GRID_SIZE)
+    code = app.exec_()
+    if os.environ.get(METRICS_ENV):
+        metrics.stopDump()
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#-*- coding: utf-8 -*-
+
+# optional instrumentation of the engine and the view
+#
+# nothing is measured until enable() is called: it replaces the instrumented methods by timing wrappers,
+# and disable() puts the original methods back, so a disabled instrumentation costs nothing
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# instrumented methods and the name of their metric
+METHODS = {'moveGridItems': 'slide',
+           'sumGridItems': 'merge',
+           'move': 'move',
+           'newGridItem': 'spawn',
+           'testEnd': 'end',
+           'legalMoves': 'legal',
+           'update': 'update',
+           '_animate': 'frame',
+           'paint': 'paint',
+           'updateIcon': 'icon'}
+
+# classes instrumented by default, by module
+TARGETS = {'game2048': ('Engine',),
+           'bitboard': ('BitboardEngine',),
+           'gui': ('Frame', 'Square', '_TileLayer')}
+
+
+class Histogram(object):
+    """ call count and latencies, bucketed by powers of 2 nanoseconds """
+    __slots__ = ('calls', 'total', 'buckets')
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.calls = 0
+        self.total = 0
+        self.buckets = [0] * 64
+
+    def add(self, duration: int):
+        self.calls += 1
+        self.total += duration
+        self.buckets[min(duration.bit_length(), 63)] += 1
+
+    def snapshot(self) -> dict:
+        return {'calls': self.calls,
+                'total_ns': self.total,
+                'mean_ns': self.total / self.calls if self.calls else 0.,
+                # upper bound of each non-empty bucket (in ns) and its count
+                'buckets': {1 << i: count for i, count in enumerate(self.buckets) if count}}
+
+
+_histograms = {}
+_originals = []  # (class, method name, original function)
+_dumper = None
+
+
+def _wrap(function, histogram: Histogram):
+    @functools.wraps(function)
+    def wrapper(*args, **kwds):
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwds)
+        finally:
+            histogram.add(time.perf_counter_ns() - start)
+    return wrapper
+
+
+def _defaultTargets() -> list:
+    # only the modules already imported are instrumented, enabling the metrics never imports Qt
+    classes = []
+    for module, names in TARGETS.items():
+        if module in sys.modules:
+            classes.extend(getattr(sys.modules[module], name) for name in names)
+    return classes
+
+
+def enable(*classes):
+    """ instrument the METHODS defined by the given classes (by default the TARGETS already imported) """
+    for cls in classes or _defaultTargets():
+        for method, label in METHODS.items():
+            function = cls.__dict__.get(method)
+            if function is None or any(c is cls and m == method for c, m, f in _originals):
+                continue
+            histogram = _histograms.setdefault(f'{cls.__name__}.{label}', Histogram())
+            _originals.append((cls, method, function))
+            setattr(cls, method, _wrap(function, histogram))
+
+
+def disable():
+    """ restore the original methods, the collected metrics are kept """
+    while _originals:
+        cls, method, function = _originals.pop()
+        setattr(cls, method, function)
+
+
+def enabled() -> bool:
+    return bool(_originals)
+
+
+def reset():
+    for histogram in _histograms.values():
+        histogram.clear()
+
+
+def snapshot() -> dict:
+    """ return the metrics collected so far, by metric name """
+    return {name: histogram.snapshot() for name, histogram in sorted(_histograms.items())}
+
+
+def dump(path: str):
+    """ write a snapshot to a JSON file, atomically """
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump({'time': time.time(), 'metrics': snapshot()}, file, indent=1)
+    os.replace(temporary, path)
+
+
+def startDump(path: str, interval=10.):
+    """ dump the metrics to path every interval seconds from a background thread """
+    global _dumper
+    stopDump()
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            dump(path)
+        dump(path)
+
+    thread = threading.Thread(target=loop, name='metrics-dump', daemon=True)
+    thread.start()
+    _dumper = stop, thread
+
+
+def stopDump():
+    """ stop the periodic dump, after a last one """
+    global _dumper
+    if _dumper is not None:
+        stop, thread = _dumper
+        stop.set()
+        thread.join()
+        _dumper = None
@@ -0,0 +1,210 @@
+#-*- coding: utf-8 -*-
+
+# pure Monte Carlo player: each legal move is evaluated by the mean score of random playouts starting with it
+#
+# the playouts are spread over a pool of processes, which read the root board from a shared memory block
+# (a generation number followed by the row-major exponents) instead of receiving it with each task
+
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+import random
+import struct
+import time
+
+from game2048 import Engine, Move
+
+BATCH = 16  # playouts per task
+MIN_BATCHES = 2  # batches of each move played before the search may stop early
+
+_GENERATION = struct.Struct('<I')
+_attached = {}  # shared memory blocks attached by a worker, by name
+
+
+def playouts(root: bytes, size: int, side: Move, count: int, seed: int, max_moves=None, deadline=None):
+    """ play count random games starting with side from the row-major exponents root, each one stopping after
+    max_moves moves if given, return the number of playouts, the sum of their scores and the sum of their squares
+
+    deadline is an optional time.time() value, the playout running when it is reached being dropped
+    """
+    rng = random.Random(seed)
+    engine = Engine(size, rng=rng)
+    sides = tuple(Move)
+    played = 0
+    total = squares = 0.
+    for i in range(count):
+        if deadline is not None and time.time() > deadline:
+            break
+        engine.load(root)
+        engine.move(side)
+        engine.newGridItem()
+        moves = 1
+        while max_moves is None or moves < max_moves:
+            legal = engine.legalMoves()
+            choices = [move for move in sides if legal[move.value]]
+            if not choices:
+                break
+            engine.move(choices[int(rng.random() * len(choices))])
+            engine.newGridItem()
+            moves += 1
+            if deadline is not None and moves & 0xF == 0 and time.time() > deadline:
+                return played, total, squares
+        played += 1
+        total += engine.score
+        squares += engine.score * engine.score
+    return played, total, squares
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # the block is unlinked by the player that created it, the workers must not track it as well
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before Python 3.13, attaching always registers the block: skip it (the tracker is shared with the player,
+        # unregistering it afterwards would drop the registration of the player)
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+
+def _sharedPlayouts(task):
+    name, generation, size, side, count, seed, max_moves, deadline = task
+    memory = _attached.get(name)
+    if memory is None:
+        memory = _attached[name] = _attach(name)
+    # the board is only valid if its generation is the one of the task before and after reading it
+    before, = _GENERATION.unpack_from(memory.buf, 0)
+    root = bytes(memory.buf[_GENERATION.size:_GENERATION.size + size * size])
+    after, = _GENERATION.unpack_from(memory.buf, 0)
+    if before != generation or after != generation:
+        return generation, side, (0, 0., 0.)
+    return generation, side, playouts(root, size, Move(side), count, seed, max_moves, deadline)
+
+
+class MonteCarloPlayer(object):
+    """ choose the move whose random playouts score best on average
+
+    rollouts is the number of playouts per legal move, time_budget (optional) caps the search duration in seconds,
+    the search stops early once the best move mean exceeds every other one by confidence standard errors;
+    workers is the number of processes (default: CPU count), 0 playing the playouts in the calling process;
+    max_moves (optional) cuts the playouts, which is needed for the games on large grids to fit in a time budget
+    """
+    def __init__(self, rollouts=256, time_budget=None, workers=None, confidence=3., max_moves=None, seed=None):
+        self.rollouts = rollouts
+        self.timeBudget = time_budget
+        self.workers = workers
+        self.confidence = confidence
+        self.maxMoves = max_moves
+        self._rng = random.Random(seed)
+        self._pool = None
+        self._memory = None
+        self._generation = 0
+        self._deadline = None
+        self.playouts = 0  # playouts of the last search
+
+    def __call__(self, engine: Engine):
+        return self.bestMove(engine)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ stop the worker processes and release the shared memory """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+    def _share(self, root: bytes) -> int:
+        """ write the root board to the shared memory, and return its generation """
+        size = _GENERATION.size + len(root)
+        if self._memory is None or self._memory.size < size:
+            if self._memory is not None:
+                self._memory.close()
+                self._memory.unlink()
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+        self._generation = (self._generation + 1) & 0xFFFFFFFF or 1
+        # invalidate the previous board while it is replaced
+        _GENERATION.pack_into(self._memory.buf, 0, 0)
+        self._memory.buf[_GENERATION.size:size] = root
+        _GENERATION.pack_into(self._memory.buf, 0, self._generation)
+        return self._generation
+
+    def _results(self, root: bytes, size: int, tasks: list):
+        """ yield the (side, playout statistics) of the tasks, in any order """
+        if self.workers == 0:
+            for side, count, seed in tasks:
+                yield side, playouts(root, size, Move(side), count, seed, self.maxMoves, self._deadline)
+                if self._deadline is not None and time.time() > self._deadline:
+                    return
+            return
+
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers)
+        generation = self._share(root)
+        name = self._memory.name
+        results = self._pool.imap_unordered(_sharedPlayouts, [(name, generation, size, side, count, seed, self.maxMoves,
+                                                               self._deadline) for side, count, seed in tasks])
+        for i in range(len(tasks)):
+            # the workers stop at the deadline, the results of the batches they cut are still collected
+            timeout = None if self._deadline is None else max(self._deadline - time.time(), 0.) + 0.05
+            try:
+                resultGeneration, side, statistics = results.next(timeout)
+            except multiprocessing.TimeoutError:
+                return
+            if resultGeneration == generation:
+                yield side, statistics
+
+    def _dominant(self, statistics: dict):
+        """ return the move whose mean is larger than all the others by confidence standard errors, or None """
+        bounds = {}
+        for side, (count, total, squares) in statistics.items():
+            if count < MIN_BATCHES * BATCH:
+                return None
+            mean = total / count
+            error = max(squares / count - mean * mean, 0.) ** 0.5 / count ** 0.5
+            bounds[side] = (mean - self.confidence * error, mean + self.confidence * error)
+        best = max(bounds, key=lambda side: statistics[side][1] / statistics[side][0])
+        if all(bounds[best][0] > upper for side, (lower, upper) in bounds.items() if side != best):
+            return best
+        return None
+
+    def bestMove(self, engine: Engine):
+        """ return the Move with the best mean playout score, or None if the game is over """
+        self.playouts = 0
+        legal = engine.legalMoves()
+        sides = [side for side in Move if legal[side.value]]
+        if len(sides) < 2:
+            return sides[0] if sides else None
+        # wall clock time, to be compared with the clock of the workers
+        self._deadline = time.time() + self.timeBudget if self.timeBudget is not None else None
+
+        # the batches are interleaved by move, so that all of them progress together
+        tasks = []
+        for first in range(0, self.rollouts, BATCH):
+            for side in sides:
+                tasks.append((side.value, min(BATCH, self.rollouts - first), self._rng.getrandbits(64)))
+
+        statistics = {side.value: (0, 0., 0.) for side in sides}
+        for side, (count, total, squares) in self._results(engine.exponents, engine.gridSize, tasks):
+            previous = statistics[side]
+            statistics[side] = (previous[0] + count, previous[1] + total, previous[2] + squares)
+            self.playouts += count
+            if self._dominant(statistics) is not None:
+                break
+            if self._deadline is not None and time.time() > self._deadline:
+                break
+
+        played = [side for side in statistics if statistics[side][0]]
+        if not played:
+            return sides[0]
+        return Move(max(played, key=lambda side: statistics[side][1] / statistics[side][0]))
@@ -0,0 +1,263 @@
+#-*- coding: utf-8 -*-
+
+# compact binary record and replay of games
+#
+# a replay file is a header (magic, version u8) followed by game records, each game record being:
+#   - a header: seed (u64), grid size (u16), flags (u8), number of moves (u32), final score (u64)
+#   - if FLAG_SPAWNS is set, the initial spawn (u32)
+#   - the moves, 2 bits each (Move.value), 4 per byte starting with the low bits, each byte being followed, if
+#     FLAG_SPAWNS is set, by one u32 per move it holds: the spawn after the move, index << 1 | (value == 4)
+# all integers are little endian; the high bits of the flags (from BACKEND_SHIFT) hold the index in BACKENDS of the
+# engine class which played the game, the engines drawing their spawns differently
+#
+# the games are written while they are played, each move byte as soon as it is full: the number of moves and the
+# score are written when the game ends, UNFINISHED standing for them until then, so that the full bytes of a game cut
+# by a crash can still be read
+#
+# version 1 files, whose spawns all follow the moves of their game, are still read
+
+import argparse
+from array import array
+from collections import namedtuple
+import importlib
+import os
+import random
+import struct
+import sys
+
+from game2048 import Engine, Move, GRID_SIZE
+
+MAGIC = b'2048'
+VERSION = 2
+FLAG_SPAWNS = 1
+UNFINISHED = 0xFFFFFFFF  # number of moves of a game being written
+BACKEND_SHIFT = 4
+BACKENDS = (('game2048', 'Engine'), ('bitboard', 'BitboardEngine'))  # (module, class name)
+
+_FILE_HEADER = struct.Struct('<4sB')
+_GAME_HEADER = struct.Struct('<QHBIQ')
+_GAME_END = struct.Struct('<IQ')  # number of moves and score, at the end of the game header
+_SPAWN = struct.Struct('<I')
+
+# the score of a game cut before its end is None
+GameRecord = namedtuple('GameRecord', 'seed size score moves spawns backend', defaults=(0,))
+
+
+def backendId(engine_class) -> int:
+    """ return the index in BACKENDS of an engine class """
+    for number, (module, name) in enumerate(BACKENDS):
+        if engine_class.__module__ == module and engine_class.__name__ == name:
+            return number
+    raise ValueError(f'the games of {engine_class.__name__} can not be recorded')
+
+
+def backendClass(number: int):
+    """ return the engine class of an index in BACKENDS, importing its module """
+    if number >= len(BACKENDS):
+        raise ValueError(f'unknown engine {number}')
+    module, name = BACKENDS[number]
+    return getattr(importlib.import_module(module), name)
+
+
+def packMoves(moves) -> bytes:
+    """ pack a sequence of Move, 4 per byte """
+    packed = bytearray((len(moves) + 3) // 4)
+    for i, side in enumerate(moves):
+        packed[i >> 2] |= side.value << (2 * (i & 3))
+    return bytes(packed)
+
+
+def unpackMoves(packed: bytes, count: int) -> list:
+    sides = tuple(Move)
+    return [sides[(packed[i >> 2] >> (2 * (i & 3))) & 3] for i in range(count)]
+
+
+def _spawnCode(engine: Engine) -> int:
+    x, y, value = engine.lastSpawn
+    return (y * engine.gridSize + x) << 1 | (value == 4)
+
+
+class ReplayWriter(object):
+    """ append games to a replay file while they are played
+
+    file is a path or a seekable binary file opened for reading and writing, spawns tells whether the spawned
+    squares are stored
+    """
+    def __init__(self, file, spawns=False):
+        self._owner = isinstance(file, str)
+        if self._owner:
+            file = open(file, 'r+b' if os.path.exists(file) else 'w+b')
+        self._file = file
+        self._file.seek(0)
+        header = self._file.read(_FILE_HEADER.size)
+        if header:
+            if len(header) < _FILE_HEADER.size or _FILE_HEADER.unpack(header) != (MAGIC, VERSION):
+                if self._owner:
+                    self._file.close()
+                raise ValueError(f'games can only be appended to replay files of version {VERSION}')
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file.write(_FILE_HEADER.pack(MAGIC, VERSION))
+        self.spawns = spawns
+        self.engine = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self, seed=None, size=GRID_SIZE, engine_class=Engine) -> Engine:
+        """ start a new game and return its engine """
+        if self.engine is not None:
+            self.end()
+        seed = random.getrandbits(64) if seed is None else seed
+        flags = (FLAG_SPAWNS if self.spawns else 0) | backendId(engine_class) << BACKEND_SHIFT
+        self.engine = engine_class(size, seed=seed)
+        self._header = self._file.tell()
+        self._file.write(_GAME_HEADER.pack(seed, size, flags, UNFINISHED, 0))
+        if self.spawns:
+            self._file.write(_SPAWN.pack(_spawnCode(self.engine)))
+        self._count = 0
+        self._chunk = bytearray(1)  # move byte being filled, followed by the spawns of its moves
+        return self.engine
+
+    def play(self, side: Move) -> bool:
+        """ play a move on the current game and record it if it modified the grid """
+        if not self.engine.move(side):
+            return False
+        self.engine.newGridItem()
+
+        self._chunk[0] |= side.value << (2 * (self._count & 3))
+        if self.spawns:
+            self._chunk += _SPAWN.pack(_spawnCode(self.engine))
+        self._count += 1
+        if self._count & 3 == 0:
+            self._file.write(self._chunk)
+            self._chunk = bytearray(1)
+        return True
+
+    def end(self):
+        """ write the last move byte of the current game, then its number of moves and score """
+        if self._count & 3:
+            self._file.write(self._chunk)
+        end = self._file.tell()
+        self._file.seek(self._header + _GAME_HEADER.size - _GAME_END.size)
+        self._file.write(_GAME_END.pack(self._count, self.engine.score))
+        self._file.seek(end)
+        self.engine = None
+
+    def close(self):
+        if self.engine is not None:
+            self.end()
+        if self._owner:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+def _read(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError('truncated replay file')
+    return data
+
+
+def readGames(file):
+    """ yield the GameRecord of a replay file one at a time, file being a path or a binary file
+
+    raise ValueError if it is not a replay file, EOFError if it is truncated
+    """
+    stream = open(file, 'rb') if isinstance(file, str) else file
+    try:
+        header = stream.read(_FILE_HEADER.size)
+        magic, version = _FILE_HEADER.unpack(header) if len(header) == _FILE_HEADER.size else (b'', 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError('not a replay file')
+        while True:
+            header = stream.read(_GAME_HEADER.size)
+            if not header:
+                return
+            if len(header) < _GAME_HEADER.size:
+                raise EOFError('truncated replay file')
+            seed, size, flags, count, score = _GAME_HEADER.unpack(header)
+            withSpawns = flags & FLAG_SPAWNS
+            if version == 1:
+                moves = _read(stream, (count + 3) // 4)
+                spawnBytes = _read(stream, 4 * (count + 1)) if withSpawns else b''
+            else:
+                spawnBytes = _read(stream, _SPAWN.size) if withSpawns else b''
+                chunk = 1 + 4 * _SPAWN.size if withSpawns else 1
+                if count == UNFINISHED:
+                    # the game was cut before its end: its full move bytes are the rest of the file
+                    block = stream.read()
+                    count = 4 * (len(block) // chunk)
+                    score = None
+                else:
+                    block = _read(stream, count // 4 * chunk + (1 + (count & 3) * 4 * bool(withSpawns)
+                                                                if count & 3 else 0))
+                moves = bytes(block[::chunk][:(count + 3) // 4])
+                if withSpawns:
+                    spawnBytes += b''.join(block[start + 1:start + chunk] for start in range(0, len(block), chunk))
+            spawns = None
+            if withSpawns:
+                spawns = array('I', spawnBytes[:4 * (count + 1)])
+                if sys.byteorder != 'little':
+                    spawns.byteswap()
+            yield GameRecord(seed, size, score, (moves, count), spawns, flags >> BACKEND_SHIFT)
+    finally:
+        if stream is not file:
+            stream.close()
+
+
+def replayGame(record: GameRecord, engine_class=None) -> Engine:
+    """ replay a game and return its final engine, raise ValueError if the record is inconsistent
+
+    engine_class must draw the spawns as the class the game was played with, which is used by default
+    """
+    if engine_class is None:
+        engine_class = backendClass(record.backend)
+    engine = engine_class(record.size, seed=record.seed)
+    for turn, side in enumerate(unpackMoves(*record.moves)):
+        if record.spawns is not None and _spawnCode(engine) != record.spawns[turn]:
+            raise ValueError(f'spawn mismatch before move {turn}')
+        if not engine.move(side):
+            raise ValueError(f'move {turn} ({side}) does not modify the grid')
+        engine.newGridItem()
+    if record.spawns is not None and _spawnCode(engine) != record.spawns[-1]:
+        raise ValueError('spawn mismatch after the last move')
+    return engine
+
+
+def verifyGame(record: GameRecord, engine_class=None) -> bool:
+    """ replay a game and check it reaches the recorded score (a game cut before its end only has to replay) """
+    try:
+        engine = replayGame(record, engine_class)
+        return record.score is None or engine.score == record.score
+    except ValueError:
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='verify the games of 2048 replay files')
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args(argv)
+
+    games = failures = 0
+    for file in args.files:
+        try:
+            for number, record in enumerate(readGames(file)):
+                games += 1
+                if not verifyGame(record):
+                    failures += 1
+                    print(f'{file}: game {number} does not replay', file=sys.stderr)
+        except (ValueError, EOFError) as error:
+            # the games read before the error are counted
+            failures += 1
+            print(f'{file}: {error}', file=sys.stderr)
+    print(f'{games} games, {failures} failures')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+#-*- coding: utf-8 -*-
+
+# headless self-play runner: plays many games in parallel and aggregates their statistics
+
+import argparse
+from collections import Counter, namedtuple
+import multiprocessing
+from queue import Empty
+import random
+import time
+
+from game2048 import Engine, Move, GRID_SIZE
+
+GameResult = namedtuple('GameResult', 'score maxTile moves wallTime')
+
+# a shard is a set of games played by one worker with its own seed
+SHARD_SIZE = 16
+
+
+class RandomStrategy(object):
+    """ play random legal moves, drawn from its own generator """
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def __call__(self, engine: Engine):
+        legal = engine.legalMoves()
+        sides = [side for side in Move if legal[side.value]]
+        return self.rng.choice(sides) if sides else None
+
+    def withSeed(self, seed):
+        """ return a new strategy drawing its moves from the given seed """
+        return RandomStrategy(seed)
+
+
+randomStrategy = RandomStrategy()
+
+
+def playGame(strategy, size=GRID_SIZE, engine_class=Engine, seed=None) -> GameResult:
+    """ play a complete game, strategy being a callable returning a Move for an engine """
+    start = time.perf_counter()
+    engine = engine_class(size, seed=seed)
+    moves = 0
+    while not engine.testEnd():
+        side = strategy(engine)
+        if side is None:
+            break
+        if not engine.move(side):
+            raise ValueError(f'{side} does not modify the grid')
+        engine.newGridItem()
+        moves += 1
+    return GameResult(engine.score, engine.maxTile, moves, time.perf_counter() - start)
+
+
+class Statistics(object):
+    """ incremental aggregation of game results """
+    def __init__(self):
+        self.games = 0
+        self.meanScore = 0.
+        self._squares = 0.
+        self.bestScore = 0
+        self.totalMoves = 0
+        self.totalTime = 0.
+        self.maxTiles = Counter()
+        self.scores = Counter()  # games per power of 2 score bucket
+
+    @property
+    def scoreDeviation(self) -> float:
+        return (self._squares / (self.games - 1)) ** 0.5 if self.games > 1 else 0.
+
+    def add(self, result: GameResult):
+        # Welford's update of the mean and variance
+        self.games += 1
+        delta = result.score - self.meanScore
+        self.meanScore += delta / self.games
+        self._squares += delta * (result.score - self.meanScore)
+
+        self.bestScore = max(self.bestScore, result.score)
+        self.totalMoves += result.moves
+        self.totalTime += result.wallTime
+        self.maxTiles[result.maxTile] += 1
+        self.scores[1 << max(result.score, 1).bit_length() - 1] += 1
+
+    def summary(self) -> dict:
+        return {'games': self.games,
+                'mean_score': self.meanScore,
+                'score_deviation': self.scoreDeviation,
+                'best_score': self.bestScore,
+                'mean_moves': self.totalMoves / self.games if self.games else 0.,
+                'moves_per_second': self.totalMoves / self.totalTime if self.totalTime else 0.,
+                'max_tiles': dict(sorted(self.maxTiles.items())),
+                'scores': dict(sorted(self.scores.items()))}
+
+
+_results = None
+
+
+def _initWorker(queue):
+    global _results
+    _results = queue
+
+
+def _playShard(task):
+    strategy, size, engine_class, seed, count = task
+    for result in _shardGames(strategy, size, engine_class, seed, count):
+        _results.put(result)
+    return count
+
+
+def _shardGames(strategy, size, engine_class, seed, count):
+    # the shard seed drives both the random strategies and the seeds of the games, the strategy given being copied
+    # (with workers == 1, the shards run in the calling process)
+    seeds = random.Random(seed)
+    shardSeed = seeds.getrandbits(64)
+    if hasattr(strategy, 'withSeed'):
+        strategy = strategy.withSeed(shardSeed)
+    for i in range(count):
+        yield playGame(strategy, size, engine_class, seeds.getrandbits(64))
+
+
+def run(games: int, strategy=randomStrategy, size=GRID_SIZE, engine_class=Engine, workers=None, seed=None):
+    """ play the games over a pool of processes and yield each GameResult as soon as it is available
+
+    strategy and engine_class must be picklable (module level functions or classes)
+    """
+    seeds = random.Random(seed)
+    tasks = []
+    for first in range(0, games, SHARD_SIZE):
+        tasks.append((strategy, size, engine_class, seeds.getrandbits(64), min(SHARD_SIZE, games - first)))
+
+    if workers == 1:
+        for task in tasks:
+            yield from _shardGames(*task)
+        return
+
+    queue = multiprocessing.Queue()
+    with multiprocessing.Pool(workers, initializer=_initWorker, initargs=(queue,)) as pool:
+        pending = pool.map_async(_playShard, tasks, chunksize=1)
+        for i in range(games):
+            while True:
+                try:
+                    result = queue.get(timeout=1)
+                    break
+                except Empty:
+                    # surface worker failures instead of waiting forever
+                    if pending.ready():
+                        pending.get()
+            yield result
+        pending.get()
+
+
+def makeStrategy(name: str, budget=0.01):
+    """ return the strategy callable of the given name """
+    if name == 'random':
+        return randomStrategy
+    if name == 'expectimax':
+        import ai
+        return ai.ExpectimaxPlayer(time_budget=budget)
+    if name == 'montecarlo':
+        # the games are already spread over processes, the playouts run in the process of their game
+        import montecarlo
+        return montecarlo.MonteCarloPlayer(time_budget=budget, workers=0)
+    raise ValueError(f'unknown strategy {name}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='play 2048 games headless and print their statistics')
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('-s', '--size', type=int, default=GRID_SIZE)
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of processes (default: CPU count)')
+    parser.add_argument('--strategy', choices=('random', 'expectimax', 'montecarlo'), default='random')
+    parser.add_argument('--budget', type=float, default=0.01, help='search time budget per move in seconds')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--bitboard', action='store_true', help='use the 4x4 bitboard engine')
+    parser.add_argument('--progress', type=int, default=0, help='print the statistics every N games')
+    args = parser.parse_args(argv)
+
+    engine_class = Engine
+    if args.bitboard:
+        import bitboard
+        engine_class = bitboard.BitboardEngine
+
+    statistics = Statistics()
+    for result in run(args.games, makeStrategy(args.strategy, args.budget), args.size, engine_class,
+                      args.workers, args.seed):
+        statistics.add(result)
+        if args.progress and statistics.games % args.progress == 0:
+            print(statistics.summary(), flush=True)
+    print(statistics.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+#-*- coding: utf-8 -*-
+
+# headless game server: many sessions on one asyncio event loop, behind a minimal local HTTP/1.1 JSON interface
+#
+#   POST   /sessions                 create a session (optional body: {"size": 4, "seed": 1})
+#   GET    /sessions/<id>            full state of a session
+#   POST   /sessions/<id>/<move>     play LEFT, RIGHT, UP or DOWN and return the squares that changed
+#   DELETE /sessions/<id>            close a session
+#
+# states are {"id", "score", "over", "grid": row-major values} and diffs {"id", "score", "over", "moved",
+# "changed": [[x, y, value], ...]}
+#
+# with a snapshot directory, the sessions are kept in a store file per grid size, the session id being the record
+# number, its generation and the grid size: they are checkpointed periodically and loaded back on their first request
+# after a restart, the stored sessions idle for too long being deleted even if they were never loaded
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+from game2048 import Engine, Move, GRID_SIZE
+from snapshot import SnapshotStore, GENERATION_BITS
+
+IDLE_TIMEOUT = 600.  # seconds without request before a session is evicted
+EVICT_INTERVAL = 10.
+MAX_BODY = 4096
+MAX_SIZE = 64  # largest grid a client can request
+SIZE_BITS = 7  # low bits of the session ids holding the grid size, when the sessions are stored
+STORE_SUFFIX = '.snp'
+
+_REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large'}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class Session(object):
+    __slots__ = ('engine', 'seen')
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.seen = time.monotonic()
+
+
+class GameServer(object):
+    """ hosts the sessions and applies their moves
+
+    moves received during the same event loop iteration are applied together, then their spawns are drawn together
+    """
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, directory=None):
+        self.idleTimeout = idle_timeout
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self._pending = []  # (session id, session, side, future) waiting for the next flush
+        self.directory = directory
+        self._stores = {}  # by grid size
+        self._checkpoint = time.monotonic()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            # the existing stores are opened right away, for their idle sessions to be evicted
+            for name in os.listdir(directory):
+                prefix, _, size = os.path.splitext(name)[0].partition('-')
+                if prefix == 'sessions' and name.endswith(STORE_SUFFIX) and size.isdigit():
+                    self._store(int(size))
+
+    # snapshots
+
+    def _store(self, size: int, create=True):
+        store = self._stores.get(size)
+        if store is None:
+            path = os.path.join(self.directory, f'sessions-{size}{STORE_SUFFIX}')
+            if not create and not os.path.exists(path):
+                return None
+            store = self._stores[size] = SnapshotStore(path, size)
+        return store
+
+    @staticmethod
+    def _sessionId(record: int, generation: int, size: int) -> int:
+        return ((record << GENERATION_BITS | generation) << SIZE_BITS) | size
+
+    @staticmethod
+    def _record(number: int) -> tuple:
+        """ return the record, generation and grid size of a stored session id """
+        return (number >> (SIZE_BITS + GENERATION_BITS), (number >> SIZE_BITS) & ((1 << GENERATION_BITS) - 1),
+                number & ((1 << SIZE_BITS) - 1))
+
+    def _restore(self, number: int):
+        """ load a stored session back, return it or None """
+        record, generation, size = self._record(number)
+        store = self._store(size, create=False) if 2 <= size <= MAX_SIZE else None
+        # the id of a deleted session does not match the generation of its record any more
+        if store is None or record not in store or store.generation(record) != generation:
+            return None
+        session = self.sessions[number] = Session(store.load(record))
+        return session
+
+    def _unstore(self, number: int):
+        if self.directory is not None:
+            record, generation, size = self._record(number)
+            store = self._stores.get(size)
+            if store is not None and store.generation(record) == generation:
+                store.delete(record)
+
+    def checkpoint(self, everything=False) -> int:
+        """ save the sessions played since the last checkpoint (or all of them), return how many were saved """
+        if self.directory is None:
+            return 0
+        start = time.monotonic()
+        # the stores keep the time since the epoch, which survives a restart
+        epoch = time.time() - start
+        saved = 0
+        for number, session in self.sessions.items():
+            if everything or session.seen >= self._checkpoint:
+                self._stores[session.engine.gridSize].save(self._record(number)[0], session.engine,
+                                                           epoch + session.seen)
+                saved += 1
+        for store in self._stores.values():
+            store.flush()
+        self._checkpoint = start
+        return saved
+
+    def closeStores(self):
+        self.checkpoint(everything=True)
+        for store in self._stores.values():
+            store.close()
+        self._stores = {}
+
+    # sessions
+
+    def create(self, size=GRID_SIZE, seed=None) -> dict:
+        if not isinstance(size, int) or not 2 <= size <= MAX_SIZE:
+            raise HttpError(400, f'size must be an integer between 2 and {MAX_SIZE}')
+        if seed is not None and not isinstance(seed, int):
+            raise HttpError(400, 'seed must be an integer')
+        engine = Engine(size, seed=seed)
+        if self.directory is None:
+            number = next(self._ids)
+        else:
+            # the record is reserved right away, the session being saved again by the next checkpoint
+            store = self._store(size)
+            record = store.allocate()
+            store.save(record, engine)
+            number = self._sessionId(record, store.generation(record), size)
+        session = self.sessions[number] = Session(engine)
+        session.engine.popChangedCells()
+        return self.state(number)
+
+    def _session(self, number: int) -> Session:
+        session = self.sessions.get(number)
+        if session is None and self.directory is not None:
+            session = self._restore(number)
+        if session is None:
+            raise HttpError(404, f'no session {number}')
+        session.seen = time.monotonic()
+        return session
+
+    def state(self, number: int) -> dict:
+        engine = self._session(number).engine
+        return {'id': number, 'score': engine.score, 'over': engine.testEnd(),
+                'grid': [1 << exponent if exponent else 0 for exponent in engine.exponents]}
+
+    def close(self, number: int) -> dict:
+        self._session(number)
+        del self.sessions[number]
+        self._unstore(number)
+        return {'id': number}
+
+    async def move(self, number: int, side: Move) -> dict:
+        session = self._session(number)
+        future = asyncio.get_running_loop().create_future()
+        if not self._pending:
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._pending.append((number, session, side, future))
+        return await future
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        # a session plays a single move per batch, the next ones wait for the following flush
+        batch, sessions = [], set()
+        for entry in pending:
+            if entry[1] in sessions:
+                if not self._pending:
+                    asyncio.get_running_loop().call_soon(self._flush)
+                self._pending.append(entry)
+            else:
+                sessions.add(entry[1])
+                batch.append(entry)
+        pending = batch
+
+        moved = [session.engine.move(side) for number, session, side, future in pending]
+        for (number, session, side, future), legal in zip(pending, moved):
+            engine = session.engine
+            if legal:
+                engine.newGridItem()
+            # the diff is taken right away: the next move of the session may be applied by the following flush
+            # before this future's coroutine resumes
+            diff = {'id': number, 'score': engine.score, 'over': engine.testEnd(), 'moved': legal,
+                    'changed': [[x, y, engine.getGridItem(x, y)] for x, y in sorted(engine.popChangedCells())]}
+            if not future.cancelled():
+                future.set_result(diff)
+
+    def evict(self) -> int:
+        """ remove the sessions idle for more than idleTimeout, return how many were removed """
+        limit = time.monotonic() - self.idleTimeout
+        idle = [number for number, session in self.sessions.items() if session.seen < limit]
+        for number in idle:
+            del self.sessions[number]
+            self._unstore(number)
+        if self.directory is None:
+            return len(idle)
+
+        # the stored sessions which were not requested since the restart are only known by their records
+        evicted = len(idle)
+        for size, store in self._stores.items():
+            for record in store.idle(time.time() - self.idleTimeout):
+                if self._sessionId(record, store.generation(record), size) not in self.sessions:
+                    store.delete(record)
+                    evicted += 1
+        return evicted
+
+    async def evictLoop(self, interval=EVICT_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            self.evict()
+            self.checkpoint()
+
+    # HTTP
+
+    async def route(self, method: str, path: str, body: bytes):
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if not parts or parts[0] != 'sessions' or len(parts) > 3:
+            raise HttpError(404, f'no resource {path}')
+        if len(parts) == 1:
+            if method != 'POST':
+                raise HttpError(405, 'use POST to create a session')
+            try:
+                options = json.loads(body) if body else {}
+            except ValueError:
+                raise HttpError(400, 'invalid JSON body')
+            if not isinstance(options, dict):
+                raise HttpError(400, 'the body must be a JSON object')
+            return 201, self.create(options.get('size', GRID_SIZE), options.get('seed'))
+
+        try:
+            number = int(parts[1])
+        except ValueError:
+            raise HttpError(404, f'no session {parts[1]}')
+        if len(parts) == 3:
+            if method != 'POST':
+                raise HttpError(405, 'use POST to play a move')
+            if parts[2].upper() not in Move.__members__:
+                raise HttpError(404, f'no move {parts[2]}')
+            return 200, await self.move(number, Move[parts[2].upper()])
+        if method == 'GET':
+            return 200, self.state(number)
+        if method == 'DELETE':
+            return 200, self.close(number)
+        raise HttpError(405, f'{method} is not supported')
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ serve the requests of a connection (kept alive until the client closes it) """
+        try:
+            while True:
+                keepAlive = True
+                try:
+                    # a line longer than the reader limit raises ValueError, answered as a malformed request
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    method, path, version = line.decode('latin-1').split()
+                    headers = {}
+                    while True:
+                        header = await reader.readline()
+                        if header in (b'\r\n', b'\n', b''):
+                            break
+                        name, _, value = header.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                    keepAlive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                    length = int(headers.get('content-length', 0))
+                    if length > MAX_BODY:
+                        keepAlive = False
+                        raise HttpError(413, 'body too large')
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self.route(method, path, body)
+                except HttpError as error:
+                    status, payload = error.status, {'error': str(error)}
+                except ValueError:
+                    keepAlive = False
+                    status, payload = 400, {'error': 'malformed request'}
+
+                content = json.dumps(payload, separators=(',', ':')).encode()
+                writer.write(f'HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(content)}\r\n'
+                             f'Connection: {"keep-alive" if keepAlive else "close"}\r\n\r\n'.encode() + content)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8048):
+        evictor = asyncio.ensure_future(self.evictLoop())
+        try:
+            server = await asyncio.start_server(self.handle, host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            evictor.cancel()
+            self.closeStores()
+
+
+async def request(reader, writer, method: str, path: str, payload=None):
+    """ send a request on an open connection and return the decoded JSON response """
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'.encode()
+                 + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b''):
+            break
+        name, _, value = header.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    response = json.loads(await reader.readexactly(length))
+    if status >= 400:
+        raise HttpError(status, response.get('error', ''))
+    return response
+
+
+async def loadTest(host: str, port: int, clients: int, moves: int, size=GRID_SIZE) -> dict:
+    """ play moves random moves from each of clients concurrent connections, return the throughput """
+    async def client(number: int):
+        reader, writer = await asyncio.open_connection(host, port)
+        rng = random.Random(number)
+        try:
+            session = (await request(reader, writer, 'POST', '/sessions', {'size': size, 'seed': number}))['id']
+            played = 0
+            for i in range(moves):
+                diff = await request(reader, writer, 'POST', f'/sessions/{session}/{rng.choice(list(Move)).name}')
+                played += 1
+                if diff['over']:
+                    break
+            await request(reader, writer, 'DELETE', f'/sessions/{session}')
+            return played
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    played = sum(await asyncio.gather(*(client(number) for number in range(clients))))
+    duration = time.perf_counter() - start
+    return {'clients': clients, 'moves': played, 'seconds': duration, 'moves_per_second': played / duration}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='serve 2048 sessions over HTTP, or load-test a server')
+    parser.add_argument('command', choices=('serve', 'bench'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8048)
+    parser.add_argument('--idle', type=float, default=IDLE_TIMEOUT, help='idle session timeout in seconds')
+    parser.add_argument('--snapshots', help='serve: directory where the sessions are kept across restarts')
+    parser.add_argument('--clients', type=int, default=100, help='bench: concurrent clients')
+    parser.add_argument('--moves', type=int, default=100, help='bench: moves per client')
+    parser.add_argument('--size', type=int, default=GRID_SIZE, help='bench: grid size')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(GameServer(args.idle, args.snapshots).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(asyncio.run(loadTest(args.host, args.port, args.clients, args.moves, args.size)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#-*- coding: utf-8 -*-
+
+# memory-mapped store of engine snapshots, so that sessions survive a restart
+#
+# a store file is a header followed by fixed-size records, the record of the session id being at
+# HEADER + id * record size, so a session is saved or loaded in constant time without parsing the file
+#   - header: magic, version (u8), grid size (u16), spawn buffer (u16), record size (u32)
+#   - record: flags (u8), number of drawn values (u16), index of the next drawn value (u32), number of empty
+#     squares (u32), generation (u32), score (u64), gauss value (f64), last time the session was seen (f64, s since
+#     the epoch), Mersenne Twister state (625 u32), drawn values
+#     (2 * SPAWN_BUFFER u32), indexes of the empty squares in the engine order (size * size u32),
+#     squares log2 exponents (size * size u8)
+# all integers are little endian
+#
+# the generation of a record is incremented each time it is deleted, so that the ids handed out for its previous
+# sessions can be told apart from the one of its new session
+
+import heapq
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+
+from game2048 import Engine, GRID_SIZE, SPAWN_BUFFER
+
+MAGIC = b'2SNP'
+VERSION = 2
+FLAG_USED = 1
+FLAG_GAUSS = 2
+FLAG_ORDER = 4  # the order of the empty squares is stored
+
+_HEADER = struct.Struct('<4sBHHI')
+HEADER_SIZE = 16
+_RECORD_HEADER = struct.Struct('<BxHIIIQdd')
+_GENERATION = struct.Struct('<I')
+_GENERATION_OFFSET = 12
+_SEEN = struct.Struct('<d')
+_SEEN_OFFSET = 32
+GENERATION_BITS = 16  # generations wrap around after 1 << GENERATION_BITS deletions of a record
+_STATE_WORDS = 625  # words of random.Random.getstate(), the last one being the position in the state
+_DRAWS = 2 * SPAWN_BUFFER
+_GROWTH = 1024  # minimum number of records added when the file grows
+
+
+def _words(values) -> bytes:
+    words = array('I', values)
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return words.tobytes()
+
+
+def _unwords(data) -> array:
+    words = array('I', data)
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return words
+
+
+class SnapshotStore(object):
+    """ fixed-size records of engines of a single grid size, in a memory-mapped file
+
+    only the engines using a random.Random generator can be stored, the records are written to disk
+    when flush is called (or by the system, at its pace)
+    """
+    def __init__(self, path: str, size=GRID_SIZE, engine_class=Engine):
+        self.path = path
+        self.gridSize = size
+        self.engineClass = engine_class
+        self.recordSize = -(-(_RECORD_HEADER.size + 4 * (_STATE_WORDS + _DRAWS) + 5 * size * size) // 8) * 8
+        header = _HEADER.pack(MAGIC, VERSION, size, SPAWN_BUFFER, self.recordSize).ljust(HEADER_SIZE, b'\0')
+
+        self._file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.write(header)
+            self._file.truncate(HEADER_SIZE + _GROWTH * self.recordSize)
+        else:
+            existing = self._file.read(HEADER_SIZE)
+            if existing[:4] != MAGIC:
+                self._file.close()
+                raise ValueError(f'{path} is not a snapshot store')
+            if existing != header:
+                self._file.close()
+                raise ValueError(f'{path} was written for another grid size, spawn buffer or version')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self.capacity = (len(self._map) - HEADER_SIZE) // self.recordSize
+
+        # the flags of every record, read with a single strided copy
+        flags = self._map[HEADER_SIZE::self.recordSize][:self.capacity]
+        self._used = {number for number, flag in enumerate(flags) if flag & FLAG_USED}
+        # heap of the ids that were free when pushed, the ones saved since are skipped lazily
+        self._free = [number for number in range(self.capacity) if number not in self._used]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._used)
+
+    def __contains__(self, number):
+        return number in self._used
+
+    def ids(self) -> list:
+        """ sorted ids of the stored sessions """
+        return sorted(self._used)
+
+    def _grow(self, capacity: int):
+        capacity = max(capacity, self.capacity + max(_GROWTH, self.capacity // 2))
+        self._map.close()
+        self._file.truncate(HEADER_SIZE + capacity * self.recordSize)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        # the new ids are larger than any other, appending them in order keeps the heap ordered
+        self._free.extend(range(self.capacity, capacity))
+        self.capacity = capacity
+
+    def generation(self, number: int) -> int:
+        """ return the number of times the record of a session id was deleted, modulo 1 << GENERATION_BITS """
+        if number >= self.capacity:
+            return 0
+        return _GENERATION.unpack_from(self._map, HEADER_SIZE + number * self.recordSize + _GENERATION_OFFSET)[0]
+
+    def seen(self, number: int) -> float:
+        """ return the time (since the epoch) given when the session id was last saved """
+        if number not in self._used:
+            raise KeyError(number)
+        return _SEEN.unpack_from(self._map, HEADER_SIZE + number * self.recordSize + _SEEN_OFFSET)[0]
+
+    def idle(self, limit: float) -> list:
+        """ sorted ids of the stored sessions last seen before limit (a time since the epoch) """
+        return [number for number in self.ids() if self.seen(number) < limit]
+
+    def allocate(self) -> int:
+        """ return the lowest free id, the record being reserved once saved
+
+        an id freed by delete is handed out again, with another generation """
+        while self._free and self._free[0] in self._used:
+            heapq.heappop(self._free)
+        if not self._free:
+            self._grow(self.capacity + 1)
+        return self._free[0]
+
+    def save(self, number: int, engine: Engine, seen=None):
+        """ write the record of an engine, replacing the previous one of the session id
+
+        seen is the time (since the epoch) the session was last used, now by default
+        """
+        if engine.gridSize != self.gridSize:
+            raise ValueError(f'the store holds {self.gridSize}x{self.gridSize} grids')
+        if not isinstance(engine._rng, random.Random):
+            raise TypeError('only the engines using a random.Random generator can be stored')
+        if number >= self.capacity:
+            self._grow(number + 1)
+        version, state, gauss = engine._rng.getstate()
+        draws = engine._draws
+        # the engines drawing the spawns among their empty squares in the increasing order do not track them
+        empty = getattr(engine, '_emptySquares', ())
+        squares = self.gridSize * self.gridSize
+
+        generation = self.generation(number)
+        offset = HEADER_SIZE + number * self.recordSize
+        flags = FLAG_USED | (FLAG_GAUSS if gauss is not None else 0) | (FLAG_ORDER if empty else 0)
+        _RECORD_HEADER.pack_into(self._map, offset, flags, len(draws), engine._drawIndex, len(empty), generation,
+                                 engine.score, gauss if gauss is not None else 0.,
+                                 time.time() if seen is None else seen)
+        offset += _RECORD_HEADER.size
+        self._map[offset:offset + 4 * _STATE_WORDS] = _words(state)
+        offset += 4 * _STATE_WORDS
+        self._map[offset:offset + 4 * len(draws)] = _words(draws)
+        offset += 4 * _DRAWS
+        self._map[offset:offset + 4 * len(empty)] = _words(empty)
+        offset += 4 * squares
+        self._map[offset:offset + squares] = engine.exponents
+
+        self._used.add(number)
+
+    def load(self, number: int) -> Engine:
+        """ rebuild the engine of a session id, in the state it was saved """
+        if number not in self._used:
+            raise KeyError(number)
+        offset = HEADER_SIZE + number * self.recordSize
+        flags, drawCount, drawIndex, emptyCount, generation, score, gauss, seen = \
+            _RECORD_HEADER.unpack_from(self._map, offset)
+        squares = self.gridSize * self.gridSize
+        offset += _RECORD_HEADER.size
+        rng = random.Random(0)  # cheaper than seeding from the system, the state is replaced
+        rng.setstate((3, tuple(_unwords(self._map[offset:offset + 4 * _STATE_WORDS])),
+                      gauss if flags & FLAG_GAUSS else None))
+        offset += 4 * _STATE_WORDS
+        draws = _unwords(self._map[offset:offset + 4 * drawCount])
+        offset += 4 * _DRAWS
+        empty = _unwords(self._map[offset:offset + 4 * emptyCount]) if flags & FLAG_ORDER else None
+        offset += 4 * squares
+
+        engine = self.engineClass.__new__(self.engineClass)
+        engine.gridSize = self.gridSize
+        engine._zobrist = None  # the hashes are computed when read
+        engine._rng = rng
+        engine._draws = draws
+        engine._drawIndex = drawIndex
+        engine.load(self._map[offset:offset + squares], score, empty)
+        return engine
+
+    def delete(self, number: int):
+        if number in self._used:
+            offset = HEADER_SIZE + number * self.recordSize
+            self._map[offset] = 0
+            _GENERATION.pack_into(self._map, offset + _GENERATION_OFFSET,
+                                  (self.generation(number) + 1) & ((1 << GENERATION_BITS) - 1))
+            self._used.remove(number)
+            heapq.heappush(self._free, number)
+
+    def checkpoint(self, engines, seen=None):
+        """ save a mapping of session ids to engines, then flush the file """
+        for number, engine in engines.items():
+            self.save(number, engine, seen)
+        self.flush()
+
+    def restore(self) -> dict:
+        """ return every stored session, by id """
+        return {number: self.load(number) for number in self.ids()}
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+            self._map = None
@@ -0,0 +1,312 @@
+#-*- coding: utf-8 -*-
+
+# exhaustive solver and on-disk tablebase of the small grids
+#
+# every board reachable from a new game is enumerated up to a tile cap (a game ends when a square reaches
+# 2 ** cap, or when no move is left), and the optimal expected score still to gain from each of them is computed
+# backward: a move keeps the sum of the squares and a spawn adds 2 or 4 to it, so the boards are evaluated by
+# decreasing sum, each one only depending on boards of a larger sum
+#
+# a tablebase file is a header followed by an open addressing hash table of the boards, looked up in place:
+#   - header: magic, version (u8), grid size (u8), tile cap (u8), number of slots (u64), number of boards (u64)
+#   - the board keys (u64 per slot, the exponents packed as nibbles, EMPTY_KEY for a free slot)
+#   - the expected scores (f32 per slot)
+#   - the best moves (u8 per slot, Move.value or NO_MOVE for a finished game)
+# all integers are little endian
+
+import argparse
+from array import array
+from collections import defaultdict
+import mmap
+import struct
+import sys
+import time
+
+from game2048 import Engine, Move, RATIO_2_ON_4
+
+MAGIC = b'2TBS'
+VERSION = 1
+EMPTY_KEY = (1 << 64) - 1
+NO_MOVE = 0xFF
+MAX_CAP = 15  # the exponents are packed as nibbles
+
+PROBABILITY_2 = RATIO_2_ON_4 / (RATIO_2_ON_4 + 1)
+PROBABILITY_4 = 1 / (RATIO_2_ON_4 + 1)
+
+_HEADER = struct.Struct('<4sBBBxQQ')
+_KEY = struct.Struct('<Q')
+_VALUE = struct.Struct('<f')
+_HASH = 0x9E3779B97F4A7C15  # Fibonacci hashing multiplier
+
+
+def boardKey(exponents) -> int:
+    """ pack row-major exponents as nibbles """
+    key = 0
+    for i, exponent in enumerate(exponents):
+        key |= exponent << (4 * i)
+    return key
+
+
+def _slot(key: int, bits: int) -> int:
+    return ((key * _HASH) & EMPTY_KEY) >> (64 - bits)
+
+
+class _Tables(object):
+    """ precomputed transformations of every row of size nibbles """
+    def __init__(self, size: int):
+        self.size = size
+        self.bits = 4 * size
+        self.mask = (1 << self.bits) - 1
+        self.shifts = range(0, self.bits * size, self.bits)
+        # the row moved toward its start and toward its end, and the score gained
+        self.start, self.end, self.startGains, self.endGains = array('Q'), array('Q'), array('L'), array('L')
+        self.largest = bytearray()  # largest exponent of the row
+        self.spread = array('Q')  # the row nibbles moved to a column (every size nibbles) of a transposed board
+        self.empty = []  # nibble shifts of the empty squares in the row
+
+        for row in range(1 << self.bits):
+            cells = [(row >> (4 * i)) & 0xF for i in range(size)]
+            self.largest.append(max(cells))
+            self.spread.append(sum(cell << (4 * size * i) for i, cell in enumerate(cells)))
+            self.empty.append(tuple(4 * i for i, cell in enumerate(cells) if cell == 0))
+            for table, gains, line in ((self.start, self.startGains, cells), (self.end, self.endGains, cells[::-1])):
+                line = [exponent for exponent in line if exponent != 0]
+                merged = []
+                gain = 0
+                i = 0
+                while i < len(line):
+                    if i + 1 < len(line) and line[i] == line[i + 1]:
+                        merged.append(line[i] + 1)
+                        gain += 2 << line[i]
+                        i += 2
+                    else:
+                        merged.append(line[i])
+                        i += 1
+                merged += [0] * (size - len(merged))
+                if table is self.end:
+                    merged.reverse()
+                table.append(boardKey(merged))
+                gains.append(gain)
+
+    def transpose(self, board: int) -> int:
+        transposed = 0
+        for y, shift in enumerate(self.shifts):
+            transposed |= self.spread[(board >> shift) & self.mask] << (4 * y)
+        return transposed
+
+    def moveRows(self, board: int, table, gains):
+        moved = gain = 0
+        for shift in self.shifts:
+            row = (board >> shift) & self.mask
+            moved |= table[row] << shift
+            gain += gains[row]
+        return moved, gain
+
+    def emptySquares(self, board: int) -> list:
+        """ nibble shifts of the empty squares """
+        return [shift + i for shift in self.shifts for i in self.empty[(board >> shift) & self.mask]]
+
+    def afterstates(self, board: int, cap: int) -> list:
+        """ return (Move, board after the move, score gained) for each legal move, none if the game is over """
+        for shift in self.shifts:
+            if self.largest[(board >> shift) & self.mask] >= cap:
+                return []
+        transposed = self.transpose(board)
+        afterstates = []
+        for side, rows, table, gains in ((Move.LEFT, board, self.start, self.startGains),
+                                         (Move.RIGHT, board, self.end, self.endGains),
+                                         (Move.UP, transposed, self.start, self.startGains),
+                                         (Move.DOWN, transposed, self.end, self.endGains)):
+            moved, gain = self.moveRows(rows, table, gains)
+            if moved != rows:
+                afterstates.append((side, moved if rows is board else self.transpose(moved), gain))
+        return afterstates
+
+
+def solve(size: int, cap: int, progress=None):
+    """ solve the size x size grid, return the keys of the reachable boards (see boardKey), their expected
+    score still to gain and their best Move values (NO_MOVE when the game is over), as three parallel arrays
+
+    progress is an optional callable receiving a message per step
+    """
+    if not 1 <= cap <= MAX_CAP:
+        raise ValueError(f'the tile cap must be between 1 and {MAX_CAP}')
+    tables = _Tables(size)
+
+    # forward pass: the boards by sum of their squares, a layer being complete once the previous ones are expanded
+    pending = defaultdict(set)
+    for shift in tables.emptySquares(0):
+        pending[2].add(1 << shift)
+        pending[4].add(2 << shift)
+    layers = {}
+    total = 2
+    while pending:
+        layer = pending.pop(total, ())
+        twos, fours = pending[total + 2], pending[total + 4]
+        for board in layer:
+            for side, moved, gain in tables.afterstates(board, cap):
+                empty = tables.emptySquares(moved)
+                twos.update([moved | (1 << shift) for shift in empty])
+                fours.update([moved | (2 << shift) for shift in empty])
+        for following in (total + 2, total + 4):
+            if not pending[following]:
+                del pending[following]
+        if layer:
+            layers[total] = array('Q', sorted(layer))
+            if progress is not None:
+                progress(f'sum {total}: {len(layer)} boards')
+        total += 2
+
+    # backward pass: each layer only needs the values of the two following ones
+    keys, values, moves = array('Q'), array('f'), bytearray()
+    following = {}  # sum: {key: value}
+    for total in sorted(layers, reverse=True):
+        known = {}
+        twos, fours = following.get(total + 2), following.get(total + 4)
+        for board in layers.pop(total):
+            best, bestValue = NO_MOVE, 0.
+            for side, moved, gain in tables.afterstates(board, cap):
+                empty = tables.emptySquares(moved)
+                value = gain + (PROBABILITY_2 * sum([twos[moved | (1 << shift)] for shift in empty])
+                                + PROBABILITY_4 * sum([fours[moved | (2 << shift)] for shift in empty])) / len(empty)
+                if best == NO_MOVE or value > bestValue:
+                    best, bestValue = side.value, value
+            known[board] = bestValue
+            keys.append(board)
+            values.append(bestValue)
+            moves.append(best)
+        following[total] = known
+        following.pop(total + 4, None)
+        if progress is not None:
+            progress(f'sum {total}: solved')
+    return keys, values, moves
+
+
+def write(path: str, size: int, cap: int, keys, values, moves):
+    """ write the arrays returned by solve as a tablebase file, with at most half of its slots used """
+    bits = max(1, (2 * len(keys) - 1).bit_length())
+    slots = 1 << bits
+    table = array('Q', [EMPTY_KEY]) * slots
+    tableValues = array('f', bytes(4 * slots))
+    tableMoves = bytearray([NO_MOVE]) * slots
+    for key, value, side in zip(keys, values, moves):
+        slot = _slot(key, bits)
+        while table[slot] != EMPTY_KEY:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = key
+        tableValues[slot] = value
+        tableMoves[slot] = side
+    if sys.byteorder != 'little':
+        table.byteswap()
+        tableValues.byteswap()
+
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, size, cap, slots, len(keys)))
+        file.write(table.tobytes())
+        file.write(tableValues.tobytes())
+        file.write(tableMoves)
+
+
+class Tablebase(object):
+    """ read-only tablebase file, memory-mapped and looked up in place
+
+    it can be used as a strategy: calling it with an engine returns the best Move for its grid
+    """
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.gridSize, self.cap, self.slots, self.boards = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f'{path} is not a tablebase')
+        self._bits = self.slots.bit_length() - 1
+        self._keys = _HEADER.size
+        self._values = self._keys + 8 * self.slots
+        self._moves = self._values + 4 * self.slots
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def lookup(self, exponents):
+        """ return (expected score still to gain, best Move or None if the game is over) for row-major exponents,
+        raise KeyError for a board that is not reachable under the tile cap """
+        if len(exponents) != self.gridSize * self.gridSize:
+            raise ValueError(f'the tablebase holds {self.gridSize}x{self.gridSize} grids')
+        key = boardKey(exponents)
+        slot = _slot(key, self._bits)
+        while True:
+            found, = _KEY.unpack_from(self._map, self._keys + 8 * slot)
+            if found == key:
+                value, = _VALUE.unpack_from(self._map, self._values + 4 * slot)
+                side = self._map[self._moves + slot]
+                return value, None if side == NO_MOVE else Move(side)
+            if found == EMPTY_KEY:
+                raise KeyError(exponents)
+            slot = (slot + 1) & (self.slots - 1)
+
+    def bestMove(self, engine: Engine):
+        """ return the optimal Move for the engine grid, or None if the game is over """
+        return self.lookup(engine.exponents)[1]
+
+    def __call__(self, engine: Engine):
+        return self.bestMove(engine)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='solve the small 2048 grids and query their tablebase')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='solve a grid size and write its tablebase')
+    build.add_argument('size', type=int, choices=(2, 3))
+    build.add_argument('output')
+    build.add_argument('--cap', type=int, default=None, help='log2 of the tile ending a game (default: 7 for 2x2 '
+                                                             'grids, which never reach it, 5 for 3x3 grids)')
+    check = commands.add_parser('check', help='play games with a strategy and compare its moves to the tablebase')
+    check.add_argument('tablebase')
+    check.add_argument('-n', '--games', type=int, default=100)
+    check.add_argument('--strategy', choices=('random', 'expectimax', 'montecarlo', 'tablebase'),
+                       default='expectimax')
+    check.add_argument('--budget', type=float, default=0.01, help='search time budget per move in seconds')
+    check.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        cap = args.cap if args.cap is not None else {2: 7, 3: 5}[args.size]
+        start = time.perf_counter()
+        keys, values, moves = solve(args.size, cap, progress=print)
+        write(args.output, args.size, cap, keys, values, moves)
+        print(f'{len(keys)} boards solved in {time.perf_counter() - start:.1f} s')
+        return 0
+
+    import random
+    import selfplay
+    with Tablebase(args.tablebase) as tablebase:
+        strategy = tablebase if args.strategy == 'tablebase' else selfplay.makeStrategy(args.strategy, args.budget)
+        seeds = random.Random(args.seed)
+        moves = agreed = 0
+        score = expected = 0.
+        for game in range(args.games):
+            engine = Engine(tablebase.gridSize, seed=seeds.getrandbits(64))
+            expected += tablebase.lookup(engine.exponents)[0]
+            while True:
+                best = tablebase.bestMove(engine)
+                if best is None:
+                    break
+                side = strategy(engine)
+                moves += 1
+                agreed += side is best
+                engine.move(side)
+                engine.newGridItem()
+            score += engine.score
+        print(f'mean score {score / args.games:.1f} (optimal expectation {expected / args.games:.1f}), '
+              f'{agreed / max(moves, 1):.1%} of {moves} moves agree with the tablebase')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#-*- coding: utf-8 -*-
+
+# parity of the move implementations on random boards: Engine.move, Engine.moveGridItems + sumGridItems,
+# BitboardEngine and BatchEngine must give the same grids, scores and legal moves
+#
+#   python -m unittest test_engines
+
+import random
+import unittest
+
+from game2048 import Engine, Move, boardHashes
+from bitboard import BitboardEngine
+
+try:
+    import numpy
+    import batch
+except ImportError:
+    batch = None
+
+BOARDS = 200  # random boards per grid size
+SIZES = (2, 3, 4, 5, 8)
+
+
+def randomBoards(size: int, count: int, seed: int) -> list:
+    """ row-major exponents, mostly small and repeated so that the lines merge a lot """
+    rng = random.Random(seed)
+    boards = []
+    for i in range(count):
+        top = rng.choice((2, 3, 5, 11))
+        boards.append(bytes(rng.choice((0, 0) + tuple(range(1, top))) for j in range(size * size)))
+    return boards
+
+
+def loaded(engine_class, exponents: bytes, size: int):
+    engine = engine_class(size)
+    engine.load(exponents)
+    return engine
+
+
+class EngineParityTest(unittest.TestCase):
+    def testTwoStepMove(self):
+        """ move is moveGridItems followed by sumGridItems """
+        for size in SIZES:
+            for exponents in randomBoards(size, BOARDS, size):
+                for side in Move:
+                    single = loaded(Engine, exponents, size)
+                    steps = loaded(Engine, exponents, size)
+                    moved = single.move(side)
+                    slid = steps.moveGridItems(side)
+                    summed = steps.sumGridItems(side)
+                    self.assertEqual(moved, slid or summed)
+                    self.assertEqual(single.exponents, steps.exponents)
+                    self.assertEqual(single.score, steps.score)
+
+    def testLegalMoves(self):
+        for size in SIZES:
+            for exponents in randomBoards(size, BOARDS, size + 100):
+                engine = loaded(Engine, exponents, size)
+                legal = engine.legalMoves()
+                for side in Move:
+                    self.assertEqual(legal[side.value], loaded(Engine, exponents, size).move(side))
+                self.assertEqual(engine.testEnd(), not any(legal))
+
+    def testBitboard(self):
+        for exponents in randomBoards(4, BOARDS, 4):
+            self.assertEqual(loaded(Engine, exponents, 4).legalMoves(),
+                             loaded(BitboardEngine, exponents, 4).legalMoves())
+            for side in Move:
+                for method in ('move', 'moveGridItems', 'sumGridItems'):
+                    engine = loaded(Engine, exponents, 4)
+                    board = loaded(BitboardEngine, exponents, 4)
+                    if method != 'move':
+                        self.assertEqual(getattr(engine, method)(side, apply=False),
+                                         getattr(board, method)(side, apply=False))
+                        self.assertEqual(board.exponents, exponents)
+                    engineTransitions, boardTransitions = [], []
+                    self.assertEqual(getattr(engine, method)(side, transitions=engineTransitions),
+                                     getattr(board, method)(side, transitions=boardTransitions), (method, side))
+                    self.assertEqual(engine.exponents, board.exponents, (method, side))
+                    self.assertEqual(engine.score, board.score, (method, side))
+                    self.assertEqual(engineTransitions, boardTransitions, (method, side))
+
+    def testDefaultSide(self):
+        """ a None side is LEFT, as for getGridItem """
+        for engine_class in (Engine, BitboardEngine):
+            for exponents in randomBoards(4, 20, 300):
+                for method in ('move', 'moveGridItems', 'sumGridItems'):
+                    default = loaded(engine_class, exponents, 4)
+                    left = loaded(engine_class, exponents, 4)
+                    self.assertEqual(getattr(default, method)(None), getattr(left, method)(Move.LEFT))
+                    self.assertEqual(default.exponents, left.exponents)
+
+    @unittest.skipIf(batch is None, 'numpy is not installed')
+    def testBatch(self):
+        for size in SIZES:
+            boards = randomBoards(size, BOARDS, size + 200)
+            for side in Move:
+                engines = batch.BatchEngine(len(boards), size)
+                engines.grid[:] = numpy.frombuffer(b''.join(boards), dtype=numpy.uint8).reshape(-1, size, size)
+                engines.score[:] = 0
+                changed = engines.moveGrids(numpy.full(len(boards), side.value))
+                for number, exponents in enumerate(boards):
+                    engine = loaded(Engine, exponents, size)
+                    self.assertEqual(engine.move(side), changed[number])
+                    self.assertEqual(engine.exponents, engines.grid[number].tobytes())
+                    self.assertEqual(engine.score, engines.score[number])
+
+
+class TransitionsTest(unittest.TestCase):
+    def testReplayTransitions(self):
+        """ the TileMove list of a move and its spawn rebuilds the grid from the previous one """
+        for size in (3, 4, 6):
+            rng = random.Random(size)
+            engine = Engine(size, seed=size)
+            while not engine.testEnd():
+                before = engine.exponents
+                transitions = []
+                if engine.move(rng.choice(list(Move)), transitions):
+                    engine.newGridItem(transitions)
+                values = [1 << exponent if exponent else 0 for exponent in before]
+                sources = {y * size + x for (x, y), destination, value, merged in
+                           (transition for transition in transitions if transition.source is not None)}
+                for index in sources:
+                    values[index] = 0
+                for source, (x, y), value, merged in transitions:
+                    if source is not None:
+                        self.assertEqual(1 << before[source[1] * size + source[0]], value)
+                    values[y * size + x] += value
+                self.assertEqual(values, [1 << exponent if exponent else 0 for exponent in engine.exponents])
+
+
+class HashTest(unittest.TestCase):
+    def testMaintainedHashes(self):
+        """ the hashes maintained by a hashing engine are the ones computed from its grid """
+        for size in (3, 4, 5):
+            rng = random.Random(size)
+            engine = Engine(size, seed=size, hashing=True)
+            turn = 0
+            while not engine.testEnd():
+                if engine.move(rng.choice(list(Move))):
+                    engine.newGridItem()
+                turn += 1
+                if turn % 13 == 0:
+                    engine.load(engine.exponents, engine.score)
+                self.assertEqual(engine._boardHashes(), boardHashes(engine.exponents, size))
+
+    def testCanonicalKey(self):
+        engine = Engine(4, seed=1)
+        for i in range(20):
+            if engine.move(Move(i % 4)):
+                engine.newGridItem()
+        exponents = engine.exponents
+        rotated = loaded(Engine, bytes(exponents[(3 - x) * 4 + y] for y in range(4) for x in range(4)), 4)
+        mirrored = loaded(Engine, bytes(exponents[y * 4 + 3 - x] for y in range(4) for x in range(4)), 4)
+        self.assertEqual(engine.canonicalKey, rotated.canonicalKey)
+        self.assertEqual(engine.canonicalKey, mirrored.canonicalKey)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#-*- coding: utf-8 -*-
+
+# round trips of the replay files
+#
+#   python -m unittest test_replay
+
+import io
+import os
+import random
+import tempfile
+import unittest
+
+from game2048 import Engine, Move
+from bitboard import BitboardEngine
+import replay
+
+
+class ReplayTest(unittest.TestCase):
+    def record(self, spawns: bool) -> tuple:
+        """ write games of both engines, return the file content and the (backend, score, moves) of each game """
+        rng = random.Random(spawns)
+        stream = io.BytesIO()
+        games = []
+        writer = replay.ReplayWriter(stream, spawns)
+        for engine_class, size in ((Engine, 4), (BitboardEngine, 4), (Engine, 3), (Engine, 6)):
+            engine = writer.start(seed=rng.getrandbits(64), size=size, engine_class=engine_class)
+            played = 0
+            while not engine.testEnd():
+                played += writer.play(rng.choice(list(Move)))
+            games.append((replay.backendId(engine_class), engine.score, played))
+        writer.close()
+        return stream.getvalue(), games
+
+    def testRoundTrip(self):
+        for spawns in (False, True):
+            data, games = self.record(spawns)
+            records = list(replay.readGames(io.BytesIO(data)))
+            self.assertEqual([(record.backend, record.score, record.moves[1]) for record in records], games)
+            for record in records:
+                self.assertEqual(record.spawns is not None, spawns)
+                self.assertTrue(replay.verifyGame(record))
+
+    def testTruncated(self):
+        data, games = self.record(True)
+        # a cut inside the first game, in its header, moves or spawns
+        for cut in (replay._FILE_HEADER.size + 3, replay._FILE_HEADER.size + replay._GAME_HEADER.size + 1,
+                    len(data) - 1):
+            with self.assertRaises(EOFError):
+                list(replay.readGames(io.BytesIO(data[:cut])))
+        with self.assertRaises(ValueError):
+            list(replay.readGames(io.BytesIO(b'20')))
+
+    def testUnfinished(self):
+        """ the full move bytes of a game cut before its end are read back, with no score """
+        for spawns in (False, True):
+            stream = io.BytesIO()
+            writer = replay.ReplayWriter(stream, spawns)
+            engine = writer.start(seed=5)
+            rng = random.Random(5)
+            played = 0
+            while played < 23:
+                played += writer.play(rng.choice(list(Move)))
+            record, = replay.readGames(io.BytesIO(stream.getvalue()))
+            self.assertIsNone(record.score)
+            self.assertEqual(record.moves[1], 20)
+            self.assertTrue(replay.verifyGame(record))
+
+    def testAppend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'games.rpl')
+            for seed in (1, 2):
+                with replay.ReplayWriter(path, spawns=True) as writer:
+                    engine = writer.start(seed=seed)
+                    for i in range(10):
+                        writer.play(Move(i % 4))
+            with open(path, 'rb') as stream:
+                records = list(replay.readGames(stream))
+            self.assertEqual([record.seed for record in records], [1, 2])
+            self.assertTrue(all(replay.verifyGame(record) for record in records))
+
+    def testPackMoves(self):
+        moves = [random.Random(7).choice(list(Move)) for i in range(37)]
+        self.assertEqual(replay.unpackMoves(replay.packMoves(moves), len(moves)), moves)
+
+
+if __name__ == '__main__':
+    unittest.main()
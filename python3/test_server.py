@@ -0,0 +1,135 @@
+#-*- coding: utf-8 -*-
+
+# in-process game server: sessions, batched moves, snapshots across a restart and the HTTP front
+#
+#   python -m unittest test_server
+
+import asyncio
+import tempfile
+import unittest
+
+from game2048 import Engine, Move
+from server import GameServer, HttpError, request
+
+
+def grid(engine: Engine) -> list:
+    return [1 << exponent if exponent else 0 for exponent in engine.exponents]
+
+
+def play(server: GameServer, number: int, sides) -> list:
+    """ play the moves of a session concurrently, return their diffs """
+    async def moves():
+        return await asyncio.gather(*(server.move(number, side) for side in sides))
+    return asyncio.run(moves())
+
+
+class SessionTest(unittest.TestCase):
+    def testLifecycle(self):
+        server = GameServer()
+        number = server.create(4, seed=1)['id']
+        engine = Engine(4, seed=1)
+        self.assertEqual(server.state(number)['grid'], grid(engine))
+        # concurrent moves of a session are applied in order, one per batch
+        sides = (Move.LEFT, Move.UP, Move.RIGHT, Move.LEFT)
+        for side, diff in zip(sides, play(server, number, sides)):
+            self.assertEqual(diff['moved'], engine.move(side))
+            if diff['moved']:
+                engine.newGridItem()
+            self.assertEqual(diff['score'], engine.score)
+        state = server.state(number)
+        self.assertEqual(state['grid'], grid(engine))
+        self.assertEqual(state['score'], engine.score)
+        server.close(number)
+        with self.assertRaises(HttpError) as error:
+            server.state(number)
+        self.assertEqual(error.exception.status, 404)
+
+    def testInvalidSize(self):
+        for size in (1, 65, '4'):
+            with self.assertRaises(HttpError):
+                GameServer().create(size)
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testRestart(self):
+        """ the sessions are served again after a restart, the ids of the deleted ones are not reused """
+        server = GameServer(directory=self.directory.name)
+        kept = server.create(4, seed=1)['id']
+        deleted = server.create(5, seed=2)['id']
+        play(server, kept, (Move.LEFT, Move.DOWN))
+        saved = server.state(kept)
+        server.close(deleted)
+        server.closeStores()
+
+        server = GameServer(directory=self.directory.name)
+        self.assertEqual(server.state(kept), saved)
+        play(server, kept, (Move.RIGHT,))
+        with self.assertRaises(HttpError) as error:
+            server.state(deleted)
+        self.assertEqual(error.exception.status, 404)
+        # the record of the deleted session is reused with another generation
+        reused = server.create(5)['id']
+        self.assertEqual(server._record(reused)[0], server._record(deleted)[0])
+        with self.assertRaises(HttpError):
+            server.state(deleted)
+        server.close(kept)
+        with self.assertRaises(HttpError):
+            server.state(kept)
+        server.closeStores()
+
+    def testEvictStored(self):
+        """ the stored sessions idle for too long are deleted even if they were not requested since the restart """
+        server = GameServer(directory=self.directory.name)
+        number = server.create(4, seed=1)['id']
+        server.closeStores()
+
+        server = GameServer(idle_timeout=0., directory=self.directory.name)
+        self.assertEqual(server.evict(), 1)
+        with self.assertRaises(HttpError):
+            server.state(number)
+        server.closeStores()
+
+
+class HttpTest(unittest.TestCase):
+    def exchange(self, coroutine):
+        """ run coroutine(reader, writer) against a server listening on a free local port """
+        async def main():
+            server = GameServer()
+            listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+            async with listener:
+                reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+                try:
+                    return await coroutine(reader, writer)
+                finally:
+                    writer.close()
+        return asyncio.run(main())
+
+    def testRequests(self):
+        async def session(reader, writer):
+            state = await request(reader, writer, 'POST', '/sessions', {'size': 3, 'seed': 4})
+            diff = await request(reader, writer, 'POST', f'/sessions/{state["id"]}/left')
+            closed = await request(reader, writer, 'DELETE', f'/sessions/{state["id"]}')
+            return state, diff, closed
+        state, diff, closed = self.exchange(session)
+        self.assertEqual(len(state['grid']), 9)
+        self.assertEqual(diff['id'], state['id'])
+        self.assertEqual(closed, {'id': state['id']})
+
+    def testLongRequestLine(self):
+        async def session(reader, writer):
+            writer.write(b'GET /' + b'x' * 70000 + b' HTTP/1.1\r\n\r\n')
+            await writer.drain()
+            return await reader.read()
+        response = self.exchange(session)
+        self.assertTrue(response.startswith(b'HTTP/1.1 400 '))
+        self.assertIn(b'Connection: close', response)
+
+
+if __name__ == '__main__':
+    unittest.main()
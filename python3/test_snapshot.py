@@ -0,0 +1,90 @@
+#-*- coding: utf-8 -*-
+
+# round trips of the snapshot stores
+#
+#   python -m unittest test_snapshot
+
+import os
+import random
+import tempfile
+import unittest
+
+from game2048 import Engine, Move
+from bitboard import BitboardEngine
+from snapshot import SnapshotStore
+
+
+def playRandom(engine, rng: random.Random, moves: int):
+    for i in range(moves):
+        if engine.testEnd():
+            break
+        if engine.move(rng.choice(list(Move))):
+            engine.newGridItem()
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sessions.snp')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testRoundTrip(self):
+        """ a restored engine plays on exactly as the saved one, after the store was reopened """
+        rng = random.Random(1)
+        engines = {}
+        with SnapshotStore(self.path, 5) as store:
+            for number in range(20):
+                engine = engines[store.allocate()] = Engine(5, seed=number)
+                playRandom(engine, rng, rng.randrange(200))
+                store.save(number, engine)
+
+        with SnapshotStore(self.path, 5) as store:
+            self.assertEqual(store.ids(), sorted(engines))
+            for number, engine in engines.items():
+                restored = store.load(number)
+                self.assertEqual(restored.exponents, engine.exponents)
+                self.assertEqual(restored.score, engine.score)
+                self.assertEqual(list(restored.emptyCells), list(engine.emptyCells))
+                playRandom(engine, random.Random(number), 100)
+                playRandom(restored, random.Random(number), 100)
+                self.assertEqual(restored.exponents, engine.exponents)
+                self.assertEqual(restored.score, engine.score)
+
+    def testBitboard(self):
+        engine = BitboardEngine(seed=3)
+        playRandom(engine, random.Random(3), 50)
+        with SnapshotStore(self.path, 4, BitboardEngine) as store:
+            store.save(store.allocate(), engine)
+            restored = store.load(0)
+        transitions = []
+        for side in Move:
+            if restored.move(side, transitions):
+                break
+        self.assertTrue(transitions)
+        engine.load(restored.exponents, restored.score)
+        playRandom(engine, random.Random(4), 50)
+        playRandom(restored, random.Random(4), 50)
+        self.assertEqual(restored.exponents, engine.exponents)
+
+    def testGenerations(self):
+        with SnapshotStore(self.path, 4) as store:
+            number = store.allocate()
+            store.save(number, Engine(4, seed=1), seen=100.)
+            self.assertEqual(store.generation(number), 0)
+            self.assertEqual(store.idle(101.), [number])
+            self.assertEqual(store.idle(99.), [])
+            store.delete(number)
+            self.assertNotIn(number, store)
+            self.assertEqual(store.allocate(), number)
+            self.assertEqual(store.generation(number), 1)
+
+    def testOtherSize(self):
+        SnapshotStore(self.path, 4).close()
+        with self.assertRaises(ValueError):
+            SnapshotStore(self.path, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
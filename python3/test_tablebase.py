@@ -0,0 +1,85 @@
+#-*- coding: utf-8 -*-
+
+# solve the 2x2 grids, write their tablebase and check its lookups against the engine
+#
+#   python -m unittest test_tablebase
+
+import os
+import random
+import tempfile
+import unittest
+
+from game2048 import Engine, Move
+import tablebase
+
+SIZE = 2
+CAP = 7  # never reached on 2x2 grids
+
+
+class TablebaseTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, '2x2.tbs')
+        cls.keys, cls.values, cls.moves = tablebase.solve(SIZE, CAP)
+        tablebase.write(cls.path, SIZE, CAP, cls.keys, cls.values, cls.moves)
+        cls.tablebase = tablebase.Tablebase(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebase.close()
+        cls.directory.cleanup()
+
+    def testLookup(self):
+        """ every solved board is found with its value and move """
+        self.assertEqual(self.tablebase.boards, len(self.keys))
+        for key, value, side in zip(self.keys, self.values, self.moves):
+            exponents = bytes((key >> (4 * i)) & 0xF for i in range(SIZE * SIZE))
+            self.assertEqual(self.tablebase.lookup(exponents),
+                             (value, None if side == tablebase.NO_MOVE else Move(side)))
+        with self.assertRaises(KeyError):
+            self.tablebase.lookup(bytes((6, 6, 6, 6)))
+        with self.assertRaises(ValueError):
+            self.tablebase.lookup(bytes(9))
+
+    def testExpectation(self):
+        """ the value of a board is the best gain of a move plus the mean value after its spawns """
+        for key in random.Random(1).sample(list(self.keys), 100):
+            exponents = bytes((key >> (4 * i)) & 0xF for i in range(SIZE * SIZE))
+            value, best = self.tablebase.lookup(exponents)
+            expectations = {}
+            for side in Move:
+                engine = Engine(SIZE, seed=0)
+                engine.load(exponents)
+                if not engine.move(side):
+                    continue
+                moved = engine.exponents
+                empty = [index for index, exponent in enumerate(moved) if exponent == 0]
+                spawned = 0.
+                for index in empty:
+                    for exponent, probability in ((1, tablebase.PROBABILITY_2), (2, tablebase.PROBABILITY_4)):
+                        board = bytearray(moved)
+                        board[index] = exponent
+                        spawned += probability * self.tablebase.lookup(bytes(board))[0]
+                expectations[side] = engine.score + spawned / len(empty)
+            if best is None:
+                self.assertEqual((value, expectations), (0., {}))
+            else:
+                self.assertAlmostEqual(value, expectations[best], places=3)
+                self.assertAlmostEqual(value, max(expectations.values()), places=3)
+
+    def testGames(self):
+        """ the games played by the tablebase only reach boards it holds """
+        for seed in range(20):
+            engine = Engine(SIZE, seed=seed)
+            while True:
+                side = self.tablebase(engine)
+                if side is None:
+                    break
+                self.assertTrue(engine.move(side))
+                engine.newGridItem()
+            self.assertTrue(engine.testEnd())
+
+
+if __name__ == '__main__':
+    unittest.main()